@@ -8,12 +8,16 @@ from app.modules.base import BaseModule
 
 # Module registry
 _modules: Dict[str, BaseModule] = {}
+# Modules sorted by order; rebuilt on the next call after a registration
+_sorted_modules: Optional[List[BaseModule]] = None
 
 
 def register_module(module_class: type) -> type:
     """Module registration decorator"""
+    global _sorted_modules
     instance = module_class()
     _modules[instance.name] = instance
+    _sorted_modules = None
     return module_class
 
 
@@ -24,7 +28,10 @@ def get_module(name: str) -> Optional[BaseModule]:
 
 def get_all_modules() -> List[BaseModule]:
     """Return all modules sorted by order"""
-    return sorted(_modules.values(), key=lambda m: m.order)
+    global _sorted_modules
+    if _sorted_modules is None:
+        _sorted_modules = sorted(_modules.values(), key=lambda m: m.order)
+    return list(_sorted_modules)
 
 
 def get_module_names() -> List[str]:
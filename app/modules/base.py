@@ -6,10 +6,13 @@ MongoDB-based config system.
 """
 
 import os
+import re
+import copy
 import subprocess
+import time
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Tuple, List, Optional
+from typing import Dict, Any, Tuple, List, Optional, Union
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -18,6 +21,24 @@ logger = logging.getLogger(__name__)
 MONGO_URI = "mongodb://localhost:27017/"
 MONGO_DB = "aco"
 MONGO_COLLECTION = "settings"
+# Every writer of the settings document bumps this field with $inc; a
+# cached copy is reused while the stored value still matches
+CONFIG_VERSION_FIELD = 'config_version'
+# Status polls within this window share one module status read (seconds)
+MODULE_STATUS_TTL = 0.2
+
+# UFW binary (/usr/sbin may not be in PATH) and files
+# (user rules are loaded as-is by iptables-restore on reload)
+UFW_BIN = '/usr/sbin/ufw'
+UFW_USER_RULES = '/etc/ufw/user.rules'
+UFW_USER6_RULES = '/etc/ufw/user6.rules'
+UFW_DEFAULTS = '/etc/default/ufw'
+UFW_CONF = '/etc/ufw/ufw.conf'
+
+# APT sources; 'apt-get update' is skipped when lists are newer than these
+APT_SOURCES = ['/etc/apt/sources.list', '/etc/apt/sources.list.d']
+APT_UPDATE_MAX_AGE = 600  # seconds
+UFW_LOCK_WAIT = 5  # seconds to keep retrying while another process holds the xtables lock
 
 
 class MongoConfig:
@@ -29,6 +50,8 @@ class MongoConfig:
     _client = None
     _db = None
     _collection = None
+    _settings_cache = None  # (config_version, document)
+    _status_snapshot = None  # (fetched_at, module statuses)
 
     def __new__(cls):
         if cls._instance is None:
@@ -53,14 +76,27 @@ class MongoConfig:
                 self._collection = None
 
     def _get_settings(self) -> Dict[str, Any]:
-        """Get settings document"""
+        """
+        Get settings document.
+        The cached copy is reused while config_version is unchanged, so a
+        read costs one small projected query instead of the full document.
+        """
         self._ensure_connection()
         if self._collection is None:
             return {}
 
         try:
-            doc = self._collection.find_one({})
-            return doc if doc else {}
+            cached = self._settings_cache
+            if cached is not None:
+                current = self._collection.find_one({}, {CONFIG_VERSION_FIELD: 1}) or {}
+                if current.get(CONFIG_VERSION_FIELD) == cached[0]:
+                    return cached[1]
+
+            doc = self._collection.find_one({}) or {}
+            version = doc.get(CONFIG_VERSION_FIELD)
+            # A document without a version (not written since install) is not cached
+            self._settings_cache = (version, doc) if version is not None else None
+            return doc
         except Exception as e:
             logger.warning(f"MongoDB read error: {e}")
             return {}
@@ -85,6 +121,9 @@ class MongoConfig:
             if value is None:
                 return default
 
+        # Copy - nested values belong to the cached document
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
         return value
 
     def set(self, key: str, value: Any) -> bool:
@@ -98,7 +137,29 @@ class MongoConfig:
         try:
             self._collection.update_one(
                 {},
-                {'$set': {key: value}},
+                {'$set': {key: value}, '$inc': {CONFIG_VERSION_FIELD: 1}},
+                upsert=True
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"MongoDB write error: {e}")
+            return False
+
+    def set_many(self, values: Dict[str, Any]) -> bool:
+        """
+        Set several config values in one write (dot notation supported).
+        """
+        if not values:
+            return True
+
+        self._ensure_connection()
+        if self._collection is None:
+            return False
+
+        try:
+            self._collection.update_one(
+                {},
+                {'$set': dict(values), '$inc': {CONFIG_VERSION_FIELD: 1}},
                 upsert=True
             )
             return True
@@ -112,7 +173,9 @@ class MongoConfig:
 
     def set_module_status(self, module_name: str, status: str) -> bool:
         """Set module status"""
-        return self.set(f'modules.{module_name}', status)
+        result = self.set(f'modules.{module_name}', status)
+        self._status_snapshot = None  # Next poll sees the new status
+        return result
 
     def is_module_completed(self, module_name: str) -> bool:
         """Is module completed?"""
@@ -174,15 +237,20 @@ class MongoConfig:
         pass
 
     def reload(self):
-        """Compatibility method - MongoDB always fresh"""
+        """
+        Multi-worker sync - nothing to drop: every read compares the stored
+        config_version, so other workers' writes are already visible and an
+        unchanged document is not fetched again.
+        """
         pass
 
     def get_all(self) -> Dict[str, Any]:
         """Return all settings"""
-        settings = self._get_settings()
-        # Remove _id field
-        if '_id' in settings:
-            del settings['_id']
+        # Copy - the cached document must not be modified
+        settings = copy.deepcopy(self._get_settings())
+        # Remove _id and version fields
+        settings.pop('_id', None)
+        settings.pop(CONFIG_VERSION_FIELD, None)
         return settings
 
     def get_all_module_statuses(self) -> Dict[str, str]:
@@ -190,6 +258,18 @@ class MongoConfig:
         modules = self.get('modules', {})
         return modules if isinstance(modules, dict) else {}
 
+    def get_polled_module_statuses(self) -> Dict[str, str]:
+        """
+        Return all module statuses for status polls.
+        Polls within MODULE_STATUS_TTL share one read; a local
+        set_module_status() drops the snapshot.
+        """
+        snapshot = self._status_snapshot
+        if snapshot is None or time.monotonic() - snapshot[0] >= MODULE_STATUS_TTL:
+            snapshot = (time.monotonic(), self.get_all_module_statuses())
+            self._status_snapshot = snapshot
+        return dict(snapshot[1])
+
     def is_setting_locked(self, key: str) -> bool:
         """
         Is setting locked? (No lock system in MongoDB anymore)
@@ -299,6 +379,9 @@ class BaseModule(ABC):
     description: str = ""
     order: int = 0
     dependencies: List[str] = []
+
+    # Last successful 'apt-get update' in this process (shared by all modules)
+    _apt_updated_at: float = 0.0
     
     def __init__(self, config_instance: 'MongoConfig' = None):
         """
@@ -318,15 +401,15 @@ class BaseModule(ABC):
         self.logger = setup_module_logger(self.name)
         self._log_file = os.path.join(LOG_DIR, f"{self.name}.log")
     
-    def get_info(self) -> Dict[str, Any]:
-        """Return module information"""
+    def get_info(self, status: Optional[str] = None) -> Dict[str, Any]:
+        """Return module information (status is read from config unless given)"""
         return {
             'name': self.name,
             'display_name': self.display_name,
             'description': self.description,
             'order': self.order,
             'dependencies': self.dependencies,
-            'status': self._config.get_module_status(self.name)
+            'status': status if status is not None else self._config.get_module_status(self.name)
         }
     
     def can_install(self) -> Tuple[bool, str]:
@@ -384,9 +467,10 @@ class BaseModule(ABC):
         command: List[str],
         check: bool = True,
         capture_output: bool = True,
-        timeout: Optional[int] = None
+        timeout: Optional[int] = None,
+        input: Optional[str] = None
     ) -> subprocess.CompletedProcess:
-        """Run command"""
+        """Run command (input is fed to stdin, e.g. for secrets kept off argv)"""
         self.logger.info(f"Command: {' '.join(command)}")
 
         try:
@@ -395,7 +479,8 @@ class BaseModule(ABC):
                 check=check,
                 capture_output=capture_output,
                 text=True,
-                timeout=timeout
+                timeout=timeout,
+                input=input
             )
             return result
         except subprocess.CalledProcessError as e:
@@ -442,9 +527,13 @@ class BaseModule(ABC):
         env['NEEDRESTART_MODE'] = 'a'  # Auto restart, no prompt
 
         try:
-            # First update (real-time log)
-            self.logger.info("Updating APT...")
-            self._run_apt_with_logging(['apt-get', 'update', '-q'], env)
+            # First update (real-time log), unless another module just did
+            if self._apt_lists_fresh():
+                self.logger.info("APT lists are up to date, skipping update")
+            else:
+                self.logger.info("Updating APT...")
+                self._run_apt_with_logging(['apt-get', 'update', '-q'], env)
+                BaseModule._apt_updated_at = time.time()
             
             # Install packages (real-time log)
             self.logger.info(f"Installing packages: {' '.join(packages)}")
@@ -464,6 +553,27 @@ class BaseModule(ABC):
             self.logger.error(f"APT installation error: {e}")
             return False
     
+    def _apt_lists_fresh(self) -> bool:
+        """
+        Check if this process ran 'apt-get update' recently and no APT
+        source (e.g. a repo added by a module) changed since.
+        """
+        updated_at = BaseModule._apt_updated_at
+        if time.time() - updated_at > APT_UPDATE_MAX_AGE:
+            return False
+
+        for source in APT_SOURCES:
+            paths = [source]
+            if os.path.isdir(source):
+                paths += [os.path.join(source, name) for name in os.listdir(source)]
+            for path in paths:
+                try:
+                    if os.stat(path).st_mtime >= updated_at:
+                        return False
+                except OSError:
+                    continue
+        return True
+
     def _run_apt_with_logging(
         self, 
         command: List[str], 
@@ -523,30 +633,91 @@ class BaseModule(ABC):
         else:
             self.logger.debug(f"[APT] {line}")
     
-    def systemctl(self, action: str, service: str) -> bool:
-        """Systemd service control"""
+    def systemctl(self, action: str, service: str, *options: str) -> bool:
+        """
+        Systemd service control.
+        Extra options go before the unit, e.g. systemctl('enable', 'x', '--now')
+        """
         try:
-            self.run_command(['systemctl', action, service])
+            self.run_command(['systemctl', action, *options, service])
             return True
         except Exception:
             return False
     
+    def run_ufw(self, *args: str) -> subprocess.CompletedProcess:
+        """
+        Run ufw with the given arguments (never raises on failure).
+        If iptables reports the xtables lock as held (tailscaled, docker),
+        retry for up to UFW_LOCK_WAIT seconds instead of failing the rule.
+        """
+        deadline = time.monotonic() + UFW_LOCK_WAIT
+        while True:
+            result = self.run_command([UFW_BIN, *args], check=False)
+            if result.returncode == 0 or 'xtables lock' not in result.stderr:
+                return result
+            if time.monotonic() >= deadline:
+                self.logger.warning(f"xtables lock still held after {UFW_LOCK_WAIT}s: ufw {' '.join(args)}")
+                return result
+            time.sleep(0.1)
+
     def write_file(self, path: str, content: str, mode: int = 0o644) -> bool:
-        """Write file"""
+        """
+        Write file atomically.
+        Content goes to a temp file in the same directory, which is then
+        renamed over the target, so readers never see a partial file.
+        """
+        tmp_path = f"{path}.tmp"
         try:
             # Create directory
             os.makedirs(os.path.dirname(path), exist_ok=True)
 
-            with open(path, 'w') as f:
+            with open(tmp_path, 'w') as f:
                 f.write(content)
 
-            os.chmod(path, mode)
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, path)
             self.logger.info(f"File written: {path}")
             return True
         except Exception as e:
             self.logger.error(f"File write error: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
             return False
     
+    def write_file_small(self, path: str, content: Union[str, bytes], mode: int = 0o644) -> bool:
+        """
+        Write a small config file in place (open/write/close, no temp file).
+        Content may be pre-encoded bytes. Not atomic - use write_file for
+        large or critical files.
+        """
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            data = content if isinstance(content, bytes) else content.encode('utf-8')
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+            try:
+                os.fchmod(fd, mode)
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+
+            self.logger.info(f"File written: {path}")
+            return True
+        except Exception as e:
+            self.logger.error(f"File write error: {e}")
+            return False
+
+    def is_file_current(self, path: str, content: Union[str, bytes]) -> bool:
+        """Check if file already exists with exactly this content (str or bytes)"""
+        try:
+            with open(path, 'rb' if isinstance(content, bytes) else 'r') as f:
+                return f.read() == content
+        except OSError:
+            return False
+
     def render_template(self, template_name: str, context: Dict[str, Any]) -> str:
         """Render Jinja2 template"""
         from jinja2 import Environment, FileSystemLoader
@@ -598,7 +769,7 @@ class BaseModule(ABC):
         grub_file = '/etc/default/grub'
         
         try:
-            with open(grub_file, 'r') as f:
+            with open(grub_file, 'r', encoding='utf-8') as f:
                 grub_content = f.read()
             
             original_content = grub_content
@@ -642,7 +813,7 @@ class BaseModule(ABC):
             
             # Any changes?
             if grub_content != original_content:
-                with open(grub_file, 'w') as f:
+                with open(grub_file, 'w', encoding='utf-8') as f:
                     f.write(grub_content)
 
                 # Run grub-mkconfig (update-grub script causes PATH issues)
@@ -682,4 +853,93 @@ class BaseModule(ABC):
             return False
         except Exception as e:
             self.logger.warning(f"GRUB configuration error: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def configure_ufw(self, rules: List[Dict[str, Any]]) -> bool:
+        """
+        Configure UFW centrally by writing its rule files directly.
+
+        Generates /etc/ufw/user.rules and user6.rules from the
+        ufw-user.rules.j2 template and loads them with a single ufw call,
+        replacing any previously added user rules.
+
+        Args:
+            rules: Ordered list of incoming rules
+                - action: 'allow' or 'deny'
+                - port: Destination port, or comma separated ports
+                  (loaded as a single multiport rule)
+                - proto: Protocol (default: 'tcp')
+                - interface: Optional input interface (e.g. 'tailscale0')
+                - comment: Optional rule comment
+
+        Default policies: deny incoming, allow outgoing, deny routed.
+
+        Returns:
+            Success status
+        """
+        try:
+            # Tuple lines must match what ufw itself writes so that
+            # 'ufw status' and later 'ufw delete' still recognise the rules
+            rule_context = [
+                {
+                    'action': rule['action'],
+                    'proto': rule.get('proto', 'tcp'),
+                    'port': rule['port'],
+                    'multiport': ',' in str(rule['port']),
+                    'interface': rule.get('interface'),
+                    'comment_hex': rule['comment'].encode('utf-8').hex() if rule.get('comment') else '',
+                }
+                for rule in rules
+            ]
+
+            for path, chain, any_addr in (
+                (UFW_USER_RULES, 'ufw', '0.0.0.0/0'),
+                (UFW_USER6_RULES, 'ufw6', '::/0'),
+            ):
+                content = self.render_template('ufw-user.rules.j2', {
+                    'chain': chain,
+                    'any_addr': any_addr,
+                    'rules': rule_context,
+                })
+                if not self.write_file(path, content, mode=0o640):
+                    return False
+
+            # Default policies
+            with open(UFW_DEFAULTS, 'r', encoding='utf-8') as f:
+                defaults = f.read()
+
+            original_defaults = defaults
+            for key, value in (
+                ('DEFAULT_INPUT_POLICY', 'DROP'),
+                ('DEFAULT_OUTPUT_POLICY', 'ACCEPT'),
+                ('DEFAULT_FORWARD_POLICY', 'DROP'),  # For Docker routing
+            ):
+                defaults = re.sub(
+                    rf'^{key}=.*$', f'{key}="{value}"', defaults, flags=re.MULTILINE
+                )
+
+            if defaults != original_defaults:
+                with open(UFW_DEFAULTS, 'w', encoding='utf-8') as f:
+                    f.write(defaults)
+
+            # A single ufw call loads both rule files atomically
+            enabled = False
+            if os.path.exists(UFW_CONF):
+                with open(UFW_CONF, 'r', encoding='utf-8') as f:
+                    enabled = re.search(r'^ENABLED=yes\s*$', f.read(), re.MULTILINE) is not None
+
+            if enabled:
+                result = self.run_ufw('reload')
+            else:
+                result = self.run_ufw('--force', 'enable')
+
+            if result.returncode != 0:
+                self.logger.warning(f"UFW load error: {result.stderr}")
+                return False
+
+            self.logger.info(f"UFW configured: {len(rules)} rules")
+            return True
+
+        except Exception as e:
+            self.logger.warning(f"UFW configuration error: {e}")
+            return False
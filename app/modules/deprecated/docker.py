@@ -10,7 +10,7 @@ from typing import Tuple, Dict, Any
 from datetime import datetime
 
 from app.modules import register_module
-from app.modules.base import BaseModule
+from app.modules.base import BaseModule, CONFIG_VERSION_FIELD
 # DIP: Global config import removed, using self._config
 
 
@@ -293,7 +293,7 @@ services:
 
             collection.update_one(
                 {'rvm_id': rvm_id},
-                {'$set': document},
+                {'$set': document, '$inc': {CONFIG_VERSION_FIELD: 1}},
                 upsert=True
             )
 
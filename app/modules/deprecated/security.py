@@ -8,64 +8,10 @@ from typing import Tuple
 from app.modules import register_module
 from app.modules.base import BaseModule
 
+SSH_CONFIG_PATH = '/etc/ssh/sshd_config.d/99-tailscale-only.conf'
+FAIL2BAN_CONFIG_PATH = '/etc/fail2ban/jail.d/sshd.conf'
 
-@register_module
-class SecurityModule(BaseModule):
-    name = "security"
-    display_name = "Security"
-    description = "UFW Firewall and SSH security configuration"
-    order = 11
-    dependencies = ["netmon", "collector", "docker"]
-    
-    def install(self) -> Tuple[bool, str]:
-        """Security configuration"""
-        try:
-            vnc_port = self.get_config('vnc.port', 5900)
-            
-            # 1. UFW installation
-            self.logger.info("Installing UFW...")
-
-            if not self.apt_install(['ufw']):
-                return False, "Could not install UFW"
-            
-            # 2. UFW rules
-            self.logger.info("Configuring UFW rules...")
-
-            # Reset first
-            result = self.run_shell('/usr/sbin/ufw --force reset', check=False)
-            if result.returncode != 0:
-                self.logger.warning(f"UFW reset failed: {result.stderr}")
-
-            # Default policies
-            self.run_command(['/usr/sbin/ufw', 'default', 'deny', 'incoming'])
-            self.run_command(['/usr/sbin/ufw', 'default', 'allow', 'outgoing'])
-            self.run_command(['/usr/sbin/ufw', 'default', 'deny', 'routed'])  # For Docker routing
-
-            # SSH over Tailscale
-            self.run_shell('/usr/sbin/ufw allow in on tailscale0 to any port 22 proto tcp')
-            
-            # VNC over Tailscale
-            self.run_shell(f'/usr/sbin/ufw allow in on tailscale0 to any port {vnc_port} proto tcp')
-            
-            # Panel over Tailscale (VPN access only)
-            self.run_shell('/usr/sbin/ufw allow in on tailscale0 to any port 4444 proto tcp')
-            
-            # MongoDB over Tailscale
-            self.run_shell('/usr/sbin/ufw allow in on tailscale0 to any port 27017 proto tcp')
-            
-            # Block SSH from LAN (except Tailscale)
-            # Note: tailscale0 rule comes first, so Tailscale access is allowed
-            self.run_shell('/usr/sbin/ufw deny 22/tcp comment "Deny SSH from LAN"')
-            
-            # Enable UFW
-            result = self.run_shell('/usr/sbin/ufw --force enable', check=False)
-            if result.returncode != 0:
-                return False, f"Could not enable UFW: {result.stderr}"
-            
-            # 3. SSH configuration
-            self.logger.info("Configuring SSH security...")
-            
-            ssh_config = """# Tailscale-only SSH Configuration
+SSH_CONFIG = """# Tailscale-only SSH Configuration
 # /etc/ssh/sshd_config.d/99-tailscale-only.conf
 
 # Root can only access via Tailscale SSH
@@ -105,18 +51,8 @@ ClientAliveCountMax 2
 # Detailed log (for security monitoring)
 LogLevel VERBOSE
 """
-            if not self.write_file('/etc/ssh/sshd_config.d/99-tailscale-only.conf', ssh_config):
-                return False, "Could not write SSH config"
 
-            # Restart SSH service
-            if not self.systemctl('restart', 'sshd'):
-                self.logger.warning("Could not restart SSHD")
-            
-            # 4. Fail2ban (optional but recommended)
-            self.logger.info("Installing Fail2ban...")
-            
-            if self.apt_install(['fail2ban']):
-                fail2ban_config = """[sshd]
+FAIL2BAN_CONFIG = """[sshd]
 enabled = true
 port = ssh
 filter = sshd
@@ -125,12 +61,78 @@ maxretry = 3
 bantime = 3600
 findtime = 600
 """
-                if not self.write_file('/etc/fail2ban/jail.d/sshd.conf', fail2ban_config):
+
+
+@register_module
+class SecurityModule(BaseModule):
+    name = "security"
+    display_name = "Security"
+    description = "UFW Firewall and SSH security configuration"
+    order = 11
+    dependencies = ["netmon", "collector", "docker"]
+    
+    def install(self) -> Tuple[bool, str]:
+        """Security configuration"""
+        try:
+            vnc_port = self.get_config('vnc.port', 5900)
+            
+            # 1. UFW installation
+            self.logger.info("Installing UFW...")
+
+            if not self.apt_install(['ufw']):
+                return False, "Could not install UFW"
+            
+            # 2. UFW rules
+            self.logger.info("Configuring UFW rules...")
+
+            # Rules go straight into /etc/ufw/user.rules and are loaded
+            # with one ufw call - no reset/enable window with open ports.
+            # Order matters: tailscale0 allows come before the SSH deny.
+            ufw_rules = [
+                # SSH over Tailscale
+                {'action': 'allow', 'port': 22, 'interface': 'tailscale0'},
+                # VNC over Tailscale
+                {'action': 'allow', 'port': vnc_port, 'interface': 'tailscale0'},
+                # Panel over Tailscale (VPN access only)
+                {'action': 'allow', 'port': 4444, 'interface': 'tailscale0'},
+                # MongoDB over Tailscale
+                {'action': 'allow', 'port': 27017, 'interface': 'tailscale0'},
+                # Block SSH from LAN (except Tailscale)
+                {'action': 'deny', 'port': 22, 'comment': 'Deny SSH from LAN'},
+            ]
+
+            if not self.configure_ufw(ufw_rules):
+                return False, "Could not configure UFW"
+            
+            # 3. SSH configuration
+            self.logger.info("Configuring SSH security...")
+            
+            if self.is_file_current(SSH_CONFIG_PATH, SSH_CONFIG):
+                self.logger.info("SSH config unchanged, skipping reload")
+            else:
+                if not self.write_file(SSH_CONFIG_PATH, SSH_CONFIG):
+                    return False, "Could not write SSH config"
+
+                # Reload (SIGHUP) keeps existing SSH sessions open
+                if not self.systemctl('reload', 'sshd'):
+                    self.logger.warning("Could not reload SSHD")
+            
+            # 4. Fail2ban (optional but recommended)
+            self.logger.info("Installing Fail2ban...")
+            
+            if self.apt_install(['fail2ban']):
+                if self.is_file_current(FAIL2BAN_CONFIG_PATH, FAIL2BAN_CONFIG):
+                    self.logger.info("Fail2ban config unchanged, skipping restart")
+                    # Enable + start (if not running) in one call
+                    if not self.systemctl('enable', 'fail2ban', '--now'):
+                        self.logger.warning("Could not enable fail2ban")
+                elif not self.write_file(FAIL2BAN_CONFIG_PATH, FAIL2BAN_CONFIG):
                     self.logger.warning("Could not write Fail2ban config")
                 else:
                     if not self.systemctl('enable', 'fail2ban'):
                         self.logger.warning("Could not enable fail2ban")
-                    if not self.systemctl('restart', 'fail2ban'):
+                    # Nothing below depends on fail2ban being up
+                    if not self.systemctl('restart', 'fail2ban', '--no-block'):
                         self.logger.warning("Could not restart fail2ban")
             
             self.logger.info("Security configuration completed")
@@ -39,14 +39,15 @@ class VNCModule(BaseModule):
             
             if vnc_password:
                 self.logger.info("Setting VNC password...")
-                result = self.run_shell(f'x11vnc -storepasswd "{vnc_password}" {vnc_dir}/passwd', check=False)
+                # argv form: the password never passes through /bin/sh quoting
+                result = self.run_command(['x11vnc', '-storepasswd', vnc_password, f'{vnc_dir}/passwd'], check=False)
                 if result.returncode != 0:
                     self.logger.warning(f"Could not set VNC password: {result.stderr}")
             else:
                 self.logger.warning("VNC password not specified! Security risk.")
             
             # Directory ownership
-            result = self.run_shell(f'chown -R {kiosk_user}:{kiosk_user} {vnc_dir}', check=False)
+            result = self.run_command(['chown', '-R', f'{kiosk_user}:{kiosk_user}', vnc_dir], check=False)
             if result.returncode != 0:
                 self.logger.warning(f"Could not set VNC directory ownership: {result.stderr}")
             
@@ -54,36 +55,21 @@ class VNCModule(BaseModule):
             vnc_port = self.get_config('vnc.port', 5900)
             localhost_only = self.get_config('vnc.localhost_only', True)
             
-            listen_arg = '-localhost' if localhost_only else ''
-            passwd_arg = f'-rfbauth {vnc_dir}/passwd' if vnc_password else ''
-            
-            service_content = f"""[Unit]
-Description=x11vnc VNC Server
-After=display-manager.service network.target
-
-[Service]
-Type=simple
-User={kiosk_user}
-Environment=DISPLAY=:0
-ExecStart=/usr/bin/x11vnc -display :0 -forever -shared {listen_arg} -rfbport {vnc_port} {passwd_arg} -noxdamage
-Restart=on-failure
-RestartSec=5
-
-[Install]
-WantedBy=multi-user.target
-"""
+            service_content = self.render_template('x11vnc.service.j2', {
+                'kiosk_user': kiosk_user,
+                'localhost_only': localhost_only,
+                'vnc_port': vnc_port,
+                'vnc_password': vnc_password,
+                'vnc_passwd_file': f'{vnc_dir}/passwd'
+            })
             if not self.write_file('/etc/systemd/system/x11vnc.service', service_content):
                 return False, "Could not write x11vnc service file"
             
-            # 4. Enable service
+            # 4. Enable and start service in one call (unit file is new,
+            # so daemon-reload is still needed once)
             self.run_command(['systemctl', 'daemon-reload'])
-            if not self.systemctl('enable', 'x11vnc'):
-                self.logger.warning("Could not enable x11vnc")
-            
-            # Start service if X11 is running
-            try:
-                self.systemctl('start', 'x11vnc')
-            except Exception:
+            if not self.systemctl('enable', 'x11vnc', '--now'):
+                # Start fails until X11 is running; the unit is enabled anyway
                 self.logger.info("x11vnc service will start after X11 is ready")
             
             # =================================================================
@@ -100,8 +86,9 @@ WantedBy=multi-user.target
             
             # Port check (only if service is active)
             if result.returncode == 0:
-                port_result = self.run_shell(f'ss -tlnp | grep :{vnc_port}', check=False)
-                if port_result.returncode != 0:
+                port_result = self.run_command(['ss', '-tlnp'], check=False)
+                listening = any(f':{vnc_port} ' in line for line in port_result.stdout.splitlines())
+                if not listening:
                     self.logger.warning(f"VNC port ({vnc_port}) not open yet")
                 else:
                     self.logger.info(f"VNC port ({vnc_port}) verified")
@@ -3,23 +3,103 @@ ACO Maintenance Panel - NVIDIA Module
 NVIDIA GPU driver installation
 
 Features:
-- GPU detection (lspci)
-- Secure Boot check (mokutil)
-- Package check (dpkg)
-- Module check (lsmod)
-- nvidia-smi verification
+- GPU detection (/sys/bus/pci)
+- Secure Boot check (efivars, mokutil fallback)
+- Package check (dpkg database)
+- Module check (/proc/modules)
+- Driver verification (NVML, nvidia-smi fallback)
+- Single state snapshot per install/status call
 - MOK key management
 - Random MOK password generation (8 digits, 1-8)
 """
 
 import os
-import random
-from typing import Tuple
+import copy
+import base64
+import glob
+import json
+import secrets
+import stat
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import requests
 
 from app.modules import register_module
 from app.modules.base import BaseModule
+from app.services import nvml
 from app.services.system import SystemService
 
+# SecureBoot EFI variable (4-byte attribute header + 1-byte value)
+SECURE_BOOT_EFIVAR = '/sys/firmware/efi/efivars/SecureBoot-*'
+
+# update-secureboot-policy --new-key timeout (seconds)
+MOK_KEYGEN_TIMEOUT = 60
+
+# PCI vendor ID for NVIDIA
+NVIDIA_PCI_VENDOR = '0x10de'
+PCI_DEVICES_DIR = '/sys/bus/pci/devices'
+
+# dpkg database (package file lists exist only for installed packages)
+DPKG_INFO_DIR = '/var/lib/dpkg/info'
+
+# NVIDIA Container Toolkit apt repository
+TOOLKIT_GPG_KEY_URL = 'https://nvidia.github.io/libnvidia-container/gpgkey'
+TOOLKIT_REPO_LIST_URL = 'https://nvidia.github.io/libnvidia-container/stable/deb/nvidia-container-toolkit.list'
+TOOLKIT_KEYRING = '/usr/share/keyrings/nvidia-container-toolkit-keyring.gpg'
+TOOLKIT_REPO_LIST = '/etc/apt/sources.list.d/nvidia-container-toolkit.list'
+
+# Docker daemon.json base settings (only applied if not already set)
+DOCKER_DAEMON_DEFAULTS = {
+    "log-driver": "json-file",
+    "log-opts": {"max-size": "10m", "max-file": "3"},
+    "storage-driver": "overlay2",
+}
+
+# Docker NVIDIA runtime entry
+DOCKER_NVIDIA_RUNTIMES = {
+    "nvidia": {
+        "path": "nvidia-container-runtime",
+        "runtimeArgs": []
+    }
+}
+
+
+def _dearmor(data: bytes) -> bytes:
+    """
+    Convert ASCII-armored OpenPGP key to binary (gpg --dearmor equivalent).
+    Binary input is returned unchanged.
+    """
+    text = data.decode('ascii', errors='ignore')
+    if '-----BEGIN PGP' not in text:
+        return data
+
+    lines = [line.strip() for line in text.splitlines()]
+    start = next(i for i, line in enumerate(lines) if line.startswith('-----BEGIN PGP'))
+    end = next(i for i, line in enumerate(lines) if line.startswith('-----END PGP'))
+    block = lines[start + 1:end]
+
+    # Armor headers (e.g. "Version: ...") end at the first blank line
+    if '' in block:
+        block = block[block.index('') + 1:]
+
+    # Drop the CRC24 checksum line ("=XXXX")
+    body = ''.join(line for line in block if line and not line.startswith('='))
+    return base64.b64decode(body)
+
+
+@dataclass
+class NvidiaState:
+    """Snapshot of NVIDIA driver state (probed once per call site)"""
+    has_gpu: bool
+    secure_boot: bool
+    package_installed: bool
+    module_loaded: bool
+    driver_working: bool
+
 
 @register_module
 class NvidiaModule(BaseModule):
@@ -29,8 +109,18 @@ class NvidiaModule(BaseModule):
     order = 2
     dependencies = ['remote-connection']  # Requires Tailscale/Remote Connection first
 
+    # Per-process probe caches (cannot change without a reboot)
+    _gpu_present: Optional[bool] = None
+    _secure_boot: Optional[bool] = None
+
+    # MOK key path cache (only set once a key file is found)
+    _mok_key: str = ''
+
     def _check_prerequisites(self) -> Tuple[bool, str]:
-        """Check internet connection"""
+        """Check internet connection (not needed without a GPU)"""
+        if not self._has_nvidia_gpu():
+            return True, ""
+
         system = SystemService()
         if not system.check_internet():
             return False, "Internet connection required"
@@ -40,16 +130,57 @@ class NvidiaModule(BaseModule):
     # Status Check Functions
     # =========================================================================
 
+    def _snapshot_state(self) -> NvidiaState:
+        """Probe all driver state once (no forks when NVML is available)"""
+        return NvidiaState(
+            has_gpu=self._has_nvidia_gpu(),
+            secure_boot=self._is_secure_boot_enabled(),
+            package_installed=self._is_package_installed(),
+            module_loaded=self._is_module_loaded(),
+            driver_working=self._is_nvidia_working(),
+        )
+
     def _has_nvidia_gpu(self) -> bool:
-        """Check if NVIDIA GPU exists (lspci)"""
-        try:
-            result = self.run_shell('lspci | grep -qi nvidia', check=False)
-            return result.returncode == 0
-        except Exception:
-            return False
+        """Check if NVIDIA GPU exists (cached per process)"""
+        if NvidiaModule._gpu_present is None:
+            NvidiaModule._gpu_present = self._probe_nvidia_gpu()
+        return NvidiaModule._gpu_present
+
+    def _probe_nvidia_gpu(self) -> bool:
+        """Check PCI vendor IDs in sysfs (lspci fallback)"""
+        if not os.path.isdir(PCI_DEVICES_DIR):
+            try:
+                result = self.run_shell('lspci | grep -qi nvidia', check=False)
+                return result.returncode == 0
+            except Exception:
+                return False
+
+        for vendor_file in glob.glob(os.path.join(PCI_DEVICES_DIR, '*', 'vendor')):
+            try:
+                with open(vendor_file, 'r') as f:
+                    if f.read().strip().lower() == NVIDIA_PCI_VENDOR:
+                        return True
+            except OSError:
+                continue
+        return False
     
     def _is_secure_boot_enabled(self) -> bool:
-        """Check if Secure Boot is enabled"""
+        """Check if Secure Boot is enabled (cached after first probe)"""
+        if self._secure_boot is None:
+            self._secure_boot = self._read_secure_boot_state()
+        return self._secure_boot
+
+    def _read_secure_boot_state(self) -> bool:
+        """Read SecureBoot EFI variable directly, fall back to mokutil"""
+        for path in glob.glob(SECURE_BOOT_EFIVAR):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if len(data) >= 5:
+                    return data[4] == 1
+            except OSError as e:
+                self.logger.debug(f"Could not read {path}: {e}")
+
         try:
             result = self.run_shell('mokutil --sb-state', check=False)
             return 'SecureBoot enabled' in result.stdout
@@ -57,7 +188,11 @@ class NvidiaModule(BaseModule):
             return False
     
     def _is_nvidia_working(self) -> bool:
-        """Check if nvidia-smi works (driver verification)"""
+        """Check if driver works (NVML, nvidia-smi fallback)"""
+        working = nvml.is_driver_working()
+        if working is not None:
+            return working
+
         try:
             result = self.run_shell('nvidia-smi', check=False)
             return result.returncode == 0
@@ -65,29 +200,56 @@ class NvidiaModule(BaseModule):
             return False
     
     def _is_package_installed(self) -> bool:
-        """Check if NVIDIA driver package is installed"""
+        """Check if NVIDIA driver package is installed (dpkg database)"""
         driver_version = self.get_config('nvidia_driver', '580')
-        try:
-            result = self.run_shell(
-                f'dpkg -l | grep -q "nvidia-driver-{driver_version}"',
-                check=False
-            )
-            return result.returncode == 0
-        except Exception:
-            return False
+        pattern = os.path.join(DPKG_INFO_DIR, f'nvidia-driver-{driver_version}*.list')
+        return bool(glob.glob(pattern))
     
     def _is_module_loaded(self) -> bool:
-        """Check if NVIDIA kernel module is loaded"""
+        """Check if NVIDIA kernel module is loaded (/proc/modules)"""
         try:
-            result = self.run_shell('lsmod | grep -q "^nvidia "', check=False)
-            return result.returncode == 0
-        except Exception:
+            with open('/proc/modules', 'r') as f:
+                return any(line.startswith('nvidia ') for line in f)
+        except OSError:
             return False
     
     # =========================================================================
     # NVIDIA Container Toolkit
     # =========================================================================
 
+    def _add_toolkit_gpg_key(self) -> bool:
+        """Download NVIDIA repo GPG key and store it dearmored (no curl/gpg)"""
+        try:
+            response = requests.get(TOOLKIT_GPG_KEY_URL, timeout=30)
+            response.raise_for_status()
+            key_data = _dearmor(response.content)
+
+            os.makedirs(os.path.dirname(TOOLKIT_KEYRING), exist_ok=True)
+            with open(TOOLKIT_KEYRING, 'wb') as f:
+                f.write(key_data)
+            os.chmod(TOOLKIT_KEYRING, 0o644)
+
+            self.logger.info(f"File written: {TOOLKIT_KEYRING}")
+            return True
+        except Exception as e:
+            self.logger.warning(f"Failed to add NVIDIA GPG key: {e}")
+            return False
+
+    def _add_toolkit_repo(self) -> bool:
+        """Download NVIDIA repo list and pin it to the keyring (no curl/sed)"""
+        try:
+            response = requests.get(TOOLKIT_REPO_LIST_URL, timeout=30)
+            response.raise_for_status()
+            repo_list = response.text.replace(
+                'deb https://',
+                f'deb [signed-by={TOOLKIT_KEYRING}] https://'
+            )
+        except Exception as e:
+            self.logger.warning(f"Failed to add NVIDIA repo: {e}")
+            return False
+
+        return self.write_file(TOOLKIT_REPO_LIST, repo_list)
+
     def _install_container_toolkit(self) -> bool:
         """
         NVIDIA Container Toolkit installation.
@@ -109,36 +271,23 @@ class NvidiaModule(BaseModule):
         self.logger.info("Installing NVIDIA Container Toolkit...")
 
         try:
-            # 1. Add GPG key
-            result = self.run_shell(
-                'curl -fsSL https://nvidia.github.io/libnvidia-container/gpgkey | '
-                'gpg --dearmor -o /usr/share/keyrings/nvidia-container-toolkit-keyring.gpg --yes',
-                check=False
-            )
-            if result.returncode != 0:
-                self.logger.warning(f"Failed to add NVIDIA GPG key: {result.stderr}")
-                return False
-
-            # 2. Add repo
-            result = self.run_shell(
-                'curl -s -L https://nvidia.github.io/libnvidia-container/stable/deb/nvidia-container-toolkit.list | '
-                'sed "s#deb https://#deb [signed-by=/usr/share/keyrings/nvidia-container-toolkit-keyring.gpg] https://#g" | '
-                'tee /etc/apt/sources.list.d/nvidia-container-toolkit.list > /dev/null',
-                check=False
-            )
-            if result.returncode != 0:
-                self.logger.warning(f"Failed to add NVIDIA repo: {result.stderr}")
+            # 1-2. Add GPG key and repo (independent downloads, run in parallel)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                key_future = executor.submit(self._add_toolkit_gpg_key)
+                repo_future = executor.submit(self._add_toolkit_repo)
+                key_ok = key_future.result()
+                repo_ok = repo_future.result()
+
+            if not key_ok or not repo_ok:
                 return False
 
-            # 3. Install package
-            self.run_command(['apt-get', 'update', '-qq'], check=False)
+            # 3. Install package (apt_install runs apt-get update itself)
             if not self.apt_install(['nvidia-container-toolkit']):
                 self.logger.warning("Failed to install nvidia-container-toolkit package")
                 return False
 
             # 4. Update Docker daemon.json (merge with existing config to preserve data-root etc.)
             self.logger.info("Configuring Docker NVIDIA runtime...")
-            import json
 
             daemon_path = '/etc/docker/daemon.json'
             daemon_config = {}
@@ -153,34 +302,40 @@ class NvidiaModule(BaseModule):
                     self.logger.warning(f"Could not read daemon.json: {e}")
                     daemon_config = {}
 
-            # Ensure base settings exist (don't overwrite if already set)
-            daemon_config.setdefault("log-driver", "json-file")
-            daemon_config.setdefault("log-opts", {"max-size": "10m", "max-file": "3"})
-            daemon_config.setdefault("storage-driver", "overlay2")
-
-            # Add NVIDIA runtime
-            daemon_config["runtimes"] = {
-                "nvidia": {
-                    "path": "nvidia-container-runtime",
-                    "runtimeArgs": []
-                }
-            }
-
-            # Write merged config
-            if not self.write_file(daemon_path, json.dumps(daemon_config, indent=4) + '\n'):
-                self.logger.warning("Failed to update Docker daemon.json")
-                return False
-
-            self.logger.info(f"daemon.json updated with NVIDIA runtime (keys: {list(daemon_config.keys())})")
-
-            # 5. Configure with nvidia-ctk
-            result = self.run_shell('nvidia-ctk runtime configure --runtime=docker', check=False)
-            if result.returncode != 0:
-                self.logger.error(f"Failed to configure nvidia-ctk: {result.stderr}")
-                return False
+            # Already configured? (base settings present + nvidia runtime registered)
+            existing_runtime = daemon_config.get('runtimes', {}).get('nvidia', {})
+            daemon_json_ok = (
+                all(key in daemon_config for key in DOCKER_DAEMON_DEFAULTS)
+                and existing_runtime.get('path') == DOCKER_NVIDIA_RUNTIMES['nvidia']['path']
+            )
 
-            # 6. Restart Docker
-            if not self.systemctl('restart', 'docker'):
+            if daemon_json_ok:
+                self.logger.info("daemon.json already has NVIDIA runtime, skipping write")
+            else:
+                # Ensure base settings exist (don't overwrite if already set)
+                for key, value in DOCKER_DAEMON_DEFAULTS.items():
+                    daemon_config.setdefault(key, copy.deepcopy(value))
+
+                # Add NVIDIA runtime
+                daemon_config["runtimes"] = copy.deepcopy(DOCKER_NVIDIA_RUNTIMES)
+
+                # Write merged config
+                if not self.write_file(daemon_path, json.dumps(daemon_config, indent=4) + '\n'):
+                    self.logger.warning("Failed to update Docker daemon.json")
+                    return False
+
+                self.logger.info(f"daemon.json updated with NVIDIA runtime (keys: {list(daemon_config.keys())})")
+
+                # 5. Configure with nvidia-ctk
+                result = self.run_shell('nvidia-ctk runtime configure --runtime=docker', check=False)
+                if result.returncode != 0:
+                    self.logger.error(f"Failed to configure nvidia-ctk: {result.stderr}")
+                    return False
+
+            # 6. Restart Docker (only if config changed or not yet loaded by dockerd)
+            if daemon_json_ok and docker_configured:
+                self.logger.info("Docker already running with NVIDIA runtime, skipping restart")
+            elif not self.systemctl('restart', 'docker'):
                 self.logger.error("Failed to restart Docker after Container Toolkit configuration")
                 return False
 
@@ -211,21 +366,79 @@ class NvidiaModule(BaseModule):
     # =========================================================================
 
     def _find_mok_key(self) -> str:
-        """Find MOK key file"""
+        """Find MOK key file (found path cached, misses re-probed)"""
+        if self._mok_key:
+            return self._mok_key
+
         mok_paths = [
             '/var/lib/shim-signed/mok/MOK.der',
             '/var/lib/dkms/mok.pub',
         ]
 
         for path in mok_paths:
-            if os.path.exists(path):
-                return path
+            try:
+                if stat.S_ISREG(os.stat(path).st_mode):
+                    self._mok_key = path
+                    return path
+            except OSError:
+                continue
 
         return ''
 
+    def _run_with_logging(self, command: List[str], timeout: int) -> Optional[int]:
+        """
+        Run command, log output line by line (no buffering).
+        Killed after timeout seconds even if it produces no output.
+        Returns exit code, or None on timeout/error.
+        """
+        self.logger.info(f"Command: {' '.join(command)}")
+
+        try:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1  # Line buffered
+            )
+        except OSError as e:
+            self.logger.error(f"Command error: {e}")
+            return None
+
+        # Watchdog - a silent hang never reaches the read loop
+        timed_out = threading.Event()
+
+        def _kill():
+            timed_out.set()
+            process.kill()
+
+        watchdog = threading.Timer(timeout, _kill)
+        watchdog.start()
+        try:
+            for line in process.stdout:
+                line = line.rstrip()
+                if line:
+                    self.logger.info(line)
+            process.wait()
+        finally:
+            watchdog.cancel()
+
+        if timed_out.is_set():
+            self.logger.error(f"Command timeout ({timeout}s): {' '.join(command)}")
+            return None
+
+        return process.returncode
+
     def _generate_mok_password(self) -> str:
         """Generate 8-digit random password using digits 1-8"""
-        return ''.join([str(random.randint(1, 8)) for _ in range(8)])
+        # Single CSPRNG draw, split into 8 base-8 digits (shifted to 1-8)
+        n = secrets.randbelow(8 ** 8)
+        digits = []
+        for _ in range(8):
+            digits.append(str(n % 8 + 1))
+            n //= 8
+        return ''.join(digits)
 
     def _is_mok_pending(self) -> bool:
         """
@@ -239,7 +452,7 @@ class NvidiaModule(BaseModule):
         except Exception:
             return False
 
-    def _detect_mok_status(self) -> str:
+    def _detect_mok_status(self, state: Optional[NvidiaState] = None) -> str:
         """
         Detect MOK status.
 
@@ -255,17 +468,20 @@ class NvidiaModule(BaseModule):
             'no_key': MOK key file not found
             'not_installed': NVIDIA package not installed
         """
+        if state is None:
+            state = self._snapshot_state()
+
         # 1. If Secure Boot is disabled, MOK is not needed
-        if not self._is_secure_boot_enabled():
+        if not state.secure_boot:
             return 'not_needed'
 
         # 2. If NVIDIA package is not installed
-        if not self._is_package_installed():
+        if not state.package_installed:
             return 'not_installed'
 
         # 3. If nvidia-smi works = enrolled and correct key
         #    This is the most reliable detection method
-        if self._is_nvidia_working():
+        if state.driver_working:
             return 'enrolled'
 
         # 4. Does MOK key file exist?
@@ -312,16 +528,17 @@ class NvidiaModule(BaseModule):
         """
         Return MOK status info for panel.
         """
-        mok_status = self._detect_mok_status()
+        state = self._snapshot_state()
+        mok_status = self._detect_mok_status(state)
         mok_password = self.get_config('mok_password')
 
         info = {
             'status': mok_status,
             'password': mok_password,
-            'secure_boot': self._is_secure_boot_enabled(),
-            'nvidia_working': self._is_nvidia_working(),
-            'module_loaded': self._is_module_loaded(),
-            'package_installed': self._is_package_installed(),
+            'secure_boot': state.secure_boot,
+            'nvidia_working': state.driver_working,
+            'module_loaded': state.module_loaded,
+            'package_installed': state.package_installed,
         }
 
         # Status messages
@@ -356,19 +573,29 @@ class NvidiaModule(BaseModule):
         if not mok_der:
             # Try to create MOK key
             self.logger.info("Creating MOK key...")
-            self.run_shell('update-secureboot-policy --new-key', check=False)
+            self._run_with_logging(
+                ['update-secureboot-policy', '--new-key'],
+                timeout=MOK_KEYGEN_TIMEOUT
+            )
             mok_der = self._find_mok_key()
 
         if not mok_der:
             self.logger.error("MOK key file not found!")
             return False
 
-        # Register MOK (use printf - works in all shells)
+        # Register MOK (password fed via stdin - no shell, no quoting)
         self.logger.info(f"Registering MOK key with UEFI: {mok_der}")
-        result = self.run_shell(
-            f'printf "%s\\n%s\\n" "{mok_password}" "{mok_password}" | mokutil --import {mok_der}',
-            check=False
-        )
+        try:
+            result = subprocess.run(
+                ['mokutil', '--import', mok_der],
+                input=f'{mok_password}\n{mok_password}\n',
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.logger.error(f"MOK import error: {e}")
+            return False
 
         if result.returncode != 0:
             # Check error message
@@ -401,22 +628,23 @@ class NvidiaModule(BaseModule):
         5. Secure Boot enabled → MOK setup → mok_pending
         6. Secure Boot disabled → reboot_required
         """
-        driver_version = self.get_config('nvidia_driver', '580')
-        current_status = self._config.get_module_status(self.name)
-        
         # =====================================================================
-        # 1. GPU Check
+        # 1. GPU Check (before any other probe)
         # =====================================================================
         if not self._has_nvidia_gpu():
             self.logger.info("No NVIDIA GPU detected, skipping installation")
             return True, "No NVIDIA GPU found, installation skipped"
 
+        driver_version = self.get_config('nvidia_driver', '580')
+        current_status = self._config.get_module_status(self.name)
+        state = self._snapshot_state()
+
         self.logger.info("NVIDIA GPU detected")
 
         # =====================================================================
         # 2. Already Working?
         # =====================================================================
-        if self._is_nvidia_working():
+        if state.driver_working:
             self.logger.info("NVIDIA driver already working")
             # Install Container Toolkit (if not present)
             if not self._install_container_toolkit():
@@ -429,14 +657,8 @@ class NvidiaModule(BaseModule):
         if current_status == 'mok_pending':
             self.logger.info("Checking MOK pending status...")
 
-            if self._is_nvidia_working():
-                self.logger.info("MOK enrollment completed, NVIDIA working")
-                # Install Container Toolkit
-                if not self._install_container_toolkit():
-                    return False, "MOK completed but Container Toolkit installation failed"
-                return True, "MOK enrollment completed, NVIDIA driver active"
-
-            if self._is_module_loaded():
+            # nvidia-smi already checked in step 2
+            if state.module_loaded:
                 self.logger.info("NVIDIA module loaded, waiting for nvidia-smi")
                 # Install Container Toolkit
                 if not self._install_container_toolkit():
@@ -456,14 +678,7 @@ class NvidiaModule(BaseModule):
         if current_status == 'reboot_required':
             self.logger.info("Checking reboot required status...")
 
-            if self._is_nvidia_working():
-                self.logger.info("NVIDIA working after reboot")
-                # Install Container Toolkit
-                if not self._install_container_toolkit():
-                    return False, "NVIDIA working but Container Toolkit installation failed"
-                return True, "NVIDIA driver active"
-
-            # Still not working - reboot not done
+            # Still not working (nvidia-smi checked in step 2) - reboot not done
             self.logger.warning("Reboot not done yet")
             self._config.set_module_status(self.name, 'reboot_required')
             return False, "System reboot required for changes to take effect"
@@ -471,7 +686,7 @@ class NvidiaModule(BaseModule):
         # =====================================================================
         # 5. Package Check and Installation
         # =====================================================================
-        if not self._is_package_installed():
+        if not state.package_installed:
             self.logger.info(f"Installing NVIDIA driver {driver_version}...")
 
             # Install only driver package (nvidia-utils comes automatically)
@@ -509,7 +724,7 @@ class NvidiaModule(BaseModule):
         # =====================================================================
         # 8. Secure Boot and MOK Status
         # =====================================================================
-        if self._is_secure_boot_enabled():
+        if state.secure_boot:
             self.logger.info("Secure Boot active, setting up MOK...")
 
             if self._setup_mok():
@@ -6,17 +6,221 @@ Note: Tailscale package is installed in install.sh.
 This module only handles enrollment and headscale connection.
 """
 
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import socket
+import threading
 import time
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from pymongo import MongoClient
 
 from app.modules import register_module
-from app.modules.base import BaseModule
+from app.modules.base import BaseModule, CONFIG_VERSION_FIELD, UFW_BIN
 from app.services.system import SystemService
 from app.services.hardware import HardwareService
 from app.services.enrollment import EnrollmentService
 
 # Constants
 APPROVAL_TIMEOUT = None  # Wait indefinitely for admin approval
+SERVICE_START_TIMEOUT = 10  # seconds, tailscaled accepting connections
+TAILSCALED_SOCKET = '/var/run/tailscale/tailscaled.sock'
+CONNECT_TIMEOUT = 10  # seconds, BackendState reaching Running after 'tailscale up'
+
+# Fixed 'tailscale up' flags; login server and hostname are added per install
+TAILSCALE_UP_FLAGS = (
+    '--auth-key=file:/dev/stdin',
+    '--advertise-tags=tag:kiosk',
+    '--ssh',
+    '--accept-dns=true',
+    '--accept-routes=false',
+    '--reset',
+)
+
+# Hardware info cache (keyed on the contents of the files below)
+HWID_CACHE_PATH = '/var/lib/aco-panel/hwid.json'
+HWID_KEY_PATHS = (
+    '/sys/class/dmi/id/board_serial',
+    '/sys/class/dmi/id/product_uuid',
+    '/proc/sys/kernel/random/boot_id',  # Hardware swaps need a reboot
+)
+
+# Ports reachable over Tailscale: SSH, VNC, Panel, MongoDB
+TAILSCALE_PORTS = '22,5900,4444,27017'
+
+# UFW rules applied after connection (order matters: tailscale0 first)
+UFW_RULES = [
+    # SSH, VNC, Panel and MongoDB via Tailscale (single multiport rule)
+    {'action': 'allow', 'port': TAILSCALE_PORTS, 'interface': 'tailscale0'},
+    # Deny SSH from LAN (tailscale rules take priority)
+    {'action': 'deny', 'port': 22},
+]
+
+
+def _port_key(ports: Optional[str]) -> Optional[str]:
+    """Order-independent form of a port list ('22,4444' == '4444,22')"""
+    return ','.join(sorted(ports.split(','))) if ports else ports
+
+
+def _rule_key(rule: Dict) -> Tuple:
+    """UFW_RULES entry as it appears in iptables-save: (interface, proto, ports, target)"""
+    return (
+        rule.get('interface'),
+        'tcp',
+        _port_key(str(rule['port'])),
+        'ACCEPT' if rule['action'] == 'allow' else 'DROP',
+    )
+
+
+EXPECTED_RULES = {_rule_key(rule) for rule in UFW_RULES}
+
+# Security config files written after connection
+SSH_CONFIG_PATH = '/etc/ssh/sshd_config.d/99-tailscale-only.conf'
+FAIL2BAN_CONFIG_PATH = '/etc/fail2ban/jail.d/sshd.conf'
+
+SSH_CONFIG = """# Tailscale-only SSH Configuration
+# This file was created by tailscale module
+
+PermitRootLogin yes
+PasswordAuthentication no
+PubkeyAuthentication no
+KbdInteractiveAuthentication no
+ChallengeResponseAuthentication no
+UsePAM yes
+AllowUsers root aco kiosk
+AllowTcpForwarding yes
+X11Forwarding no
+PermitTunnel no
+GatewayPorts no
+LoginGraceTime 20
+MaxAuthTries 3
+MaxSessions 2
+ClientAliveInterval 300
+ClientAliveCountMax 2
+LogLevel VERBOSE
+"""
+
+FAIL2BAN_CONFIG = """[sshd]
+enabled = true
+port = ssh
+filter = sshd
+backend = systemd
+maxretry = 3
+bantime = 3600
+findtime = 600
+"""
+
+# Encoded once at import; written with a single os.write
+SSH_CONFIG_BYTES = SSH_CONFIG.encode('utf-8')
+FAIL2BAN_CONFIG_BYTES = FAIL2BAN_CONFIG.encode('utf-8')
+
+# Written after a successful security configuration; a matching version
+# means the same SSH/fail2ban/UFW settings are already applied
+SECURITY_MARKER_PATH = '/var/lib/aco-panel/security.version'
+SECURITY_VERSION = hashlib.blake2b(
+    SSH_CONFIG_BYTES + FAIL2BAN_CONFIG_BYTES + repr(UFW_RULES).encode('utf-8'),
+    digest_size=16
+).hexdigest()
+
+# Shared MongoDB client (created on first use, closed at exit)
+_mongo_client = None
+_mongo_lock = threading.Lock()
+
+
+def _get_mongo_client():
+    """Return the process-wide MongoClient"""
+    global _mongo_client
+    if _mongo_client is not None:
+        return _mongo_client
+
+    # Install threads may race here; only one may create the client
+    with _mongo_lock:
+        if _mongo_client is not None:
+            return _mongo_client
+
+        # Always local: skip topology discovery, keep connects/reads short
+        _mongo_client = MongoClient(
+            'mongodb://localhost:27017/',
+            directConnection=True,
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=500,
+            socketTimeoutMS=1000,
+            maxPoolSize=2
+        )
+        atexit.register(_mongo_client.close)
+    return _mongo_client
+
+
+class Transaction:
+    """
+    (apply, rollback) steps.
+    If a step fails, rollbacks of the already applied steps run in reverse.
+    """
+
+    def __init__(self, logger):
+        self._logger = logger
+        self._steps = []
+        self._applied = []
+
+    def add(self, name: str, apply_fn: Callable[[], Tuple[bool, str]],
+            rollback_fn: Optional[Callable[[], None]] = None) -> None:
+        """Add a step; apply_fn returns (success, error_message)"""
+        self._steps.append((name, apply_fn, rollback_fn))
+
+    @staticmethod
+    def _apply(apply_fn: Callable[[], Tuple[bool, str]]) -> Tuple[bool, str]:
+        """Run one apply function, turning exceptions into a failure"""
+        try:
+            return apply_fn()
+        except Exception as e:
+            return False, str(e)
+
+    def run(self, parallel: bool = False) -> Tuple[bool, str]:
+        """
+        Apply all steps (in order, or concurrently for independent steps).
+        Returns (success, error_message)
+        """
+        if parallel:
+            with ThreadPoolExecutor(max_workers=len(self._steps) or 1) as executor:
+                futures = [executor.submit(self._apply, apply_fn) for _, apply_fn, _ in self._steps]
+                results = [future.result() for future in futures]
+
+            # Every step has run, so all of them are rolled back on failure
+            self._applied = [(name, rollback_fn) for name, _, rollback_fn in self._steps if rollback_fn]
+            for (name, _, _), (ok, error) in zip(self._steps, results):
+                if not ok:
+                    self._logger.error("%s failed, rolling back: %s", name, error)
+                    self.rollback()
+                    return False, error
+            return True, ""
+
+        for name, apply_fn, rollback_fn in self._steps:
+            ok, error = self._apply(apply_fn)
+
+            if rollback_fn:
+                # Failed steps may be partially applied, roll them back too
+                self._applied.append((name, rollback_fn))
+
+            if not ok:
+                self._logger.error("%s failed, rolling back: %s", name, error)
+                self.rollback()
+                return False, error
+
+        return True, ""
+
+    def rollback(self) -> None:
+        """Roll back applied steps in reverse order"""
+        for name, rollback_fn in reversed(self._applied):
+            try:
+                rollback_fn()
+            except Exception as e:
+                self._logger.warning("Rollback of %s failed: %s", name, e)
+        self._applied = []
 
 
 @register_module
@@ -41,13 +245,99 @@ class TailscaleModule(BaseModule):
 
     def _is_tailscale_installed(self) -> bool:
         """Check if Tailscale is installed"""
-        result = self.run_command(['which', 'tailscale'], check=False)
-        return result.returncode == 0
+        return shutil.which('tailscale') is not None
 
     def _is_tailscale_connected(self) -> bool:
-        """Check if Tailscale is connected"""
-        result = self.run_command(['tailscale', 'status'], check=False)
-        return result.returncode == 0
+        """
+        Check if Tailscale is connected (BackendState Running).
+        Only queries the local node; the parsed status is kept in
+        self._tailscale_status for logging.
+        """
+        self._tailscale_status = None
+        result = self.run_command(
+            ['tailscale', 'status', '--self', '--peers=false', '--json'],
+            check=False
+        )
+        if result.returncode != 0:
+            return False
+        try:
+            self._tailscale_status = json.loads(result.stdout)
+        except ValueError:
+            return False
+        return self._tailscale_status.get('BackendState') == 'Running'
+
+    def _hardware_fingerprint(self) -> str:
+        """
+        Cheap fingerprint of the hardware: board serial and product UUID
+        (both stable across boots) plus the boot ID, so the cache is
+        reused within a boot and re-probed after every reboot.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for path in HWID_KEY_PATHS:
+            try:
+                with open(path, 'rb') as f:
+                    digest.update(f.read().strip())
+            except OSError:
+                digest.update(b'-')
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def _load_cached_hwid(self, fingerprint: str) -> Optional[Dict[str, str]]:
+        """Return cached hardware info if the fingerprint still matches"""
+        try:
+            with open(HWID_CACHE_PATH, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if cached.get('fingerprint') != fingerprint or not cached.get('hardware_id'):
+            return None
+        return cached
+
+    def _save_cached_hwid(self, fingerprint: str, hardware_id: str,
+                          motherboard_uuid: str, mac_addresses: str) -> None:
+        """Write hardware info cache atomically"""
+        tmp_path = f"{HWID_CACHE_PATH}.tmp"
+        try:
+            os.makedirs(os.path.dirname(HWID_CACHE_PATH), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'fingerprint': fingerprint,
+                    'hardware_id': hardware_id,
+                    'motherboard_uuid': motherboard_uuid,
+                    'mac_addresses': mac_addresses,
+                }, f)
+            os.replace(tmp_path, HWID_CACHE_PATH)
+        except OSError as e:
+            self.logger.warning("Could not cache hardware info: %s", e)
+
+    def _is_tailscaled_ready(self) -> bool:
+        """Check if tailscaled accepts connections on its local API socket"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(TAILSCALED_SOCKET)
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def _wait_until(self, predicate: Callable[[], bool], timeout: float = 10.0,
+                    initial: float = 0.05, factor: float = 2.0) -> bool:
+        """
+        Poll predicate until it returns True or timeout expires.
+        Backoff starts at initial seconds and grows by factor up to 0.5s.
+        """
+        deadline = time.monotonic() + timeout
+        delay = initial
+        while True:
+            if predicate():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * factor, 0.5)
 
     def install(self) -> Tuple[bool, str]:
         """
@@ -60,37 +350,56 @@ class TailscaleModule(BaseModule):
                 self.logger.info("Tailscale already connected, skipping installation")
                 return True, "Tailscale already connected"
 
-            # 1. Generate Hardware ID
-            hardware = HardwareService()
-            hardware_id = hardware.get_hardware_id()
-
-            if not hardware_id:
-                return False, "Failed to generate Hardware ID"
+            # Config values used below (each accessor is a MongoDB read)
+            cfg = self._config
+            rvm_id = cfg.get_rvm_id()
+            enrollment_url = cfg.get_enrollment_url()
+            headscale_url = cfg.get_headscale_url()
+
+            # 1. Generate Hardware ID (cached across runs)
+            fingerprint = self._hardware_fingerprint()
+            cached = self._load_cached_hwid(fingerprint)
+
+            if cached:
+                self.logger.info("Using cached hardware info")
+                hardware_id = cached['hardware_id']
+                motherboard_uuid = cached.get('motherboard_uuid', '')
+                mac_addresses = cached.get('mac_addresses', '')
+            else:
+                # Hardware probes are independent subprocess/sysfs reads, run in parallel
+                hardware = HardwareService()
+                with ThreadPoolExecutor(max_workers=3) as executor:
+                    hardware_id_future = executor.submit(hardware.get_hardware_id)
+                    uuid_future = executor.submit(hardware.get_motherboard_uuid)
+                    mac_future = executor.submit(hardware.get_mac_addresses)
+                    hardware_id = hardware_id_future.result()
+                    motherboard_uuid = uuid_future.result()
+                    mac_addresses = mac_future.result()
+
+                if not hardware_id:
+                    return False, "Failed to generate Hardware ID"
+
+                # Only a complete probe is cached; a failed serial is retried next run
+                if all(hardware.get_components().values()):
+                    self._save_cached_hwid(fingerprint, hardware_id, motherboard_uuid, mac_addresses)
 
             # Save to config
-            self._config.set_hardware_id(hardware_id)
-            self.logger.info(f"Hardware ID: {hardware_id}")
-
-            # 2. Get RVM ID (should be set beforehand)
-            rvm_id = self._config.get_rvm_id()
+            cfg.set_hardware_id(hardware_id)
+            self.logger.info("Hardware ID: %s", hardware_id)
 
+            # 2. RVM ID (should be set beforehand)
             if not rvm_id:
                 return False, "RVM ID not found"
 
-            self.logger.info(f"RVM ID: {rvm_id}")
+            self.logger.info("RVM ID: %s", rvm_id)
 
             # 3. Register with Enrollment API
-            enrollment_url = self._config.get_enrollment_url()
             enrollment = EnrollmentService(api_url=enrollment_url)
 
-            self.logger.info(f"Registering with Enrollment API: {enrollment_url}")
+            self.logger.info("Registering with Enrollment API: %s", enrollment_url)
 
-            # Get additional info
-            motherboard_uuid = hardware.get_motherboard_uuid()
-            mac_addresses = hardware.get_mac_addresses()
-
-            self.logger.info(f"Motherboard UUID: {motherboard_uuid}")
-            self.logger.info(f"MAC Addresses: {mac_addresses}")
+            self.logger.info("Motherboard UUID: %s", motherboard_uuid)
+            self.logger.info("MAC Addresses: %s", mac_addresses)
 
             enroll_result = enrollment.enroll(
                 rvm_id,
@@ -102,7 +411,7 @@ class TailscaleModule(BaseModule):
             if not enroll_result['success']:
                 return False, enroll_result.get('error', 'Enrollment failed')
 
-            self.logger.info(f"Enrollment status: {enroll_result.get('status')}")
+            self.logger.info("Enrollment status: %s", enroll_result.get('status'))
 
             # 4. Check if already approved (auth_key might be in response)
             auth_key = enroll_result.get('auth_key')
@@ -123,53 +432,47 @@ class TailscaleModule(BaseModule):
 
             self.logger.info("Tailscale installed")
 
-            # 7. Start tailscaled service
+            # 7. Start tailscaled service (enable + start in one call)
             self.logger.info("Starting tailscaled service...")
-            if not self.systemctl('enable', 'tailscaled'):
-                return False, "Failed to enable tailscaled service"
-            if not self.systemctl('start', 'tailscaled'):
-                return False, "Failed to start tailscaled service"
-
-            # Wait for service to start
-            time.sleep(3)
+            if not self.systemctl('enable', 'tailscaled', '--now'):
+                return False, "Failed to enable and start tailscaled service"
 
-            # Verify tailscaled is running
-            if not self.systemctl('is-active', 'tailscaled'):
+            # Wait for tailscaled to become active
+            # Socket connect is in-process, no systemctl fork per poll
+            if not self._wait_until(self._is_tailscaled_ready, timeout=SERVICE_START_TIMEOUT):
                 return False, "Tailscaled service is not running"
 
             # 8. Connect to Headscale (with full parameters!)
-            headscale_url = self._config.get_headscale_url()
-            self.logger.info(f"Connecting to Headscale: {headscale_url}")
+            self.logger.info("Connecting to Headscale: %s", headscale_url)
 
+            # Auth key is read from stdin so it never appears in argv
+            # (/proc/*/cmdline) or in the command log line
             result = self.run_command([
                 'tailscale', 'up',
                 '--login-server', headscale_url,
-                '--authkey', auth_key,
                 '--hostname', rvm_id.lower(),
-                '--advertise-tags=tag:kiosk',
-                '--ssh',
-                '--accept-dns=true',
-                '--accept-routes=false',
-                '--reset'
-            ], check=False)
+                *TAILSCALE_UP_FLAGS
+            ], check=False, input=f'{auth_key}\n')
 
             if result.returncode != 0:
-                self.logger.error(f"Tailscale up error: {result.stderr}")
-                return False, f"Headscale connection failed: {result.stderr}"
+                stderr = result.stderr.replace(auth_key, '***')
+                self.logger.error("Tailscale up error: %s", stderr)
+                return False, f"Headscale connection failed: {stderr}"
 
             # 9. Verify connection
-            time.sleep(3)
-
-            if not self._is_tailscale_connected():
+            if not self._wait_until(self._is_tailscale_connected, timeout=CONNECT_TIMEOUT):
                 self.logger.error("Tailscale connection not verified")
                 return False, "Tailscale connection to Headscale could not be verified"
 
             self.logger.info("Tailscale connection verified")
 
-            # Log status info
-            status_result = self.run_command(['tailscale', 'status'], check=False)
-            if status_result.returncode == 0:
-                self.logger.info(f"Tailscale status:\n{status_result.stdout}")
+            # Log status info (from the verification above, no extra call)
+            self_node = self._tailscale_status.get('Self') or {}
+            self.logger.info(
+                "Tailscale status: %s %s",
+                self_node.get('HostName'),
+                ', '.join(self_node.get('TailscaleIPs') or [])
+            )
 
             # 10. Save RVM ID to MongoDB (for other services)
             mongo_ok, mongo_error = self._save_rvm_id_to_mongodb(rvm_id, hardware_id)
@@ -186,202 +489,265 @@ class TailscaleModule(BaseModule):
             return True, "Tailscale installed and connected to Headscale"
 
         except Exception as e:
-            self.logger.error(f"Tailscale installation error: {e}")
+            self.logger.error("Tailscale installation error: %s", e)
             return False, str(e)
 
     def _configure_security(self) -> Tuple[bool, str]:
         """
         Security configuration after Tailscale connection.
         UFW rules, SSH config and fail2ban settings.
-        Idempotent - skips if already configured.
+        Idempotent - skips if this version was already applied.
         Returns (success, error_message)
         """
         self.logger.info("Starting security configuration...")
 
+        if self._security_marker_current():
+            self.logger.info("Security configuration unchanged, skipping")
+            return True, ""
+
         try:
-            # 1. Check if UFW is installed
-            ufw_check = self.run_shell('which /usr/sbin/ufw', check=False)
-            if ufw_check.returncode != 0:
+            # 1. Check if UFW and fail2ban are installed (in-process, no subprocess)
+            fail2ban_installed = shutil.which('fail2ban-client') is not None
+
+            if not os.access(UFW_BIN, os.X_OK):
                 self.logger.error("UFW is not installed!")
                 return False, "UFW is not installed. Run install.sh first."
 
-            # 2. Check if already configured (idempotent)
-            ufw_status = self.run_shell('/usr/sbin/ufw status', check=False)
-            if 'tailscale0' in ufw_status.stdout and 'Status: active' in ufw_status.stdout:
+            # 2. UFW rules already loaded - only SSH/fail2ban may need work
+            current_rules = self._current_rules()
+            ufw_current = bool(current_rules) and EXPECTED_RULES <= current_rules
+            if ufw_current:
                 self.logger.info("UFW already configured with tailscale0 rules, skipping")
-                return True, ""
 
-            # 3. UFW configuration (from scratch)
-            self.logger.info("Configuring UFW...")
-
-            # Reset first
-            self.run_shell('/usr/sbin/ufw --force reset 2>/dev/null || true', check=False)
-
-            # Default policies
-            self.run_shell('/usr/sbin/ufw default deny incoming', check=False)
-            self.run_shell('/usr/sbin/ufw default allow outgoing', check=False)
-            self.run_shell('/usr/sbin/ufw default deny routed', check=False)
-
-            # Tailscale0 interface permissions
-            ufw_rules = [
-                # SSH via Tailscale
-                ('/usr/sbin/ufw allow in on tailscale0 to any port 22 proto tcp', '22/tcp on tailscale0'),
-                # VNC via Tailscale
-                ('/usr/sbin/ufw allow in on tailscale0 to any port 5900 proto tcp', '5900/tcp on tailscale0'),
-                # Panel via Tailscale
-                ('/usr/sbin/ufw allow in on tailscale0 to any port 4444 proto tcp', '4444/tcp on tailscale0'),
-                # MongoDB via Tailscale
-                ('/usr/sbin/ufw allow in on tailscale0 to any port 27017 proto tcp', '27017/tcp on tailscale0'),
-                # Deny SSH from LAN (tailscale rules take priority)
-                ('/usr/sbin/ufw deny 22/tcp', '22/tcp'),
-            ]
-
-            rules_added = 0
-            for rule_cmd, rule_check in ufw_rules:
-                result = self.run_shell(rule_cmd, check=False)
-                if result.returncode == 0:
-                    self.logger.info(f"UFW rule added: {rule_check}")
-                    rules_added += 1
-                else:
-                    self.logger.error(f"Failed to add UFW rule: {rule_cmd} - {result.stderr}")
-
-            self.logger.info(f"UFW: {rules_added}/{len(ufw_rules)} rules added")
-
-            # Check if any rules were added
-            if rules_added == 0:
-                return False, "Failed to add any UFW rules"
-
-            # Enable UFW
-            ufw_enable_result = self.run_shell('/usr/sbin/ufw --force enable', check=False)
-            if ufw_enable_result.returncode == 0:
-                self.logger.info("UFW enabled")
-            else:
-                self.logger.error(f"Failed to enable UFW: {ufw_enable_result.stderr}")
-                return False, f"Failed to enable UFW: {ufw_enable_result.stderr}"
-
-            # Verify: UFW status and rules
-            ufw_status = self.run_shell('/usr/sbin/ufw status', check=False)
-            if 'active' in ufw_status.stdout.lower():
-                self.logger.info("UFW status verified: active")
-
-                # Verify rules
-                rules_verified = 0
-                for _, rule_check in ufw_rules:
-                    if rule_check in ufw_status.stdout:
-                        rules_verified += 1
-                    else:
-                        self.logger.warning(f"UFW rule not found: {rule_check}")
-
-                self.logger.info(f"UFW rules verified: {rules_verified}/{len(ufw_rules)}")
+            # Check if fail2ban is installed (checked in step 1)
+            if not fail2ban_installed:
+                self.logger.error("Fail2ban is not installed!")
+                return False, "Fail2ban is not installed. Run install.sh first."
+
+            # 3-5. UFW, SSH and fail2ban are independent - configure them
+            # concurrently (each is dominated by subprocess/service restarts).
+            # SSH and fail2ban form a transaction: if any part fails their
+            # config files are restored. UFW is not rolled back - it only
+            # restricts access, reverting it would reopen ports.
+            transaction = Transaction(self.logger)
+            transaction.add(
+                "SSH configuration",
+                self._configure_ssh,
+                self._make_restore(SSH_CONFIG_PATH, 'sshd')
+            )
+            transaction.add(
+                "Fail2ban configuration",
+                self._configure_fail2ban,
+                self._make_restore(FAIL2BAN_CONFIG_PATH, 'fail2ban')
+            )
+
+            if ufw_current:
+                ufw_ok, ufw_error = True, ""
+                config_ok, config_error = transaction.run(True)
             else:
-                self.logger.error(f"UFW not active! Status: {ufw_status.stdout.strip()}")
-                return False, "UFW failed to activate"
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    ufw_future = executor.submit(self._configure_ufw_rules)
+                    config_future = executor.submit(transaction.run, True)
+                    ufw_ok, ufw_error = ufw_future.result()
+                    config_ok, config_error = config_future.result()
+
+            if not ufw_ok:
+                if config_ok:
+                    transaction.rollback()
+                return False, ufw_error
+            if not config_ok:
+                return False, config_error
+
+            self._write_security_marker()
+            self.logger.info("Security configuration completed")
+            return True, ""
 
-            # 3. SSH configuration (Tailscale-only)
-            self.logger.info("Configuring SSH...")
+        except Exception as e:
+            self.logger.error("Security configuration error: %s", e)
+            return False, str(e)
 
-            ssh_config = """# Tailscale-only SSH Configuration
-# This file was created by tailscale module
+    def _security_marker_current(self) -> bool:
+        """Check if the marker records the current SECURITY_VERSION"""
+        try:
+            with open(SECURITY_MARKER_PATH, 'r') as f:
+                return f.read() == SECURITY_VERSION
+        except OSError:
+            return False
 
-PermitRootLogin yes
-PasswordAuthentication no
-PubkeyAuthentication no
-KbdInteractiveAuthentication no
-ChallengeResponseAuthentication no
-UsePAM yes
-AllowUsers root aco kiosk
-AllowTcpForwarding yes
-X11Forwarding no
-PermitTunnel no
-GatewayPorts no
-LoginGraceTime 20
-MaxAuthTries 3
-MaxSessions 2
-ClientAliveInterval 300
-ClientAliveCountMax 2
-LogLevel VERBOSE
-"""
-            if not self.write_file('/etc/ssh/sshd_config.d/99-tailscale-only.conf', ssh_config):
-                self.logger.error("Failed to write SSH config")
-                return False, "Failed to write SSH configuration"
+    def _write_security_marker(self) -> None:
+        """Record SECURITY_VERSION as applied (a failed write only costs a re-run)"""
+        if not self.write_file_small(SECURITY_MARKER_PATH, SECURITY_VERSION):
+            self.logger.warning("Could not write security marker: %s", SECURITY_MARKER_PATH)
+
+    def _configure_ufw_rules(self) -> Tuple[bool, str]:
+        """UFW configuration. Returns (success, error_message)"""
+        self.logger.info("Configuring UFW...")
+
+        try:
+            if not self.configure_ufw(UFW_RULES):
+                return False, "Failed to configure UFW"
+            if not self._verify_ufw_rules():
+                return False, "UFW failed to activate"
+            return True, ""
+        except Exception as e:
+            self.logger.error("UFW configuration error: %s", e)
+            return False, str(e)
 
-            if not self.systemctl('restart', 'sshd'):
-                self.logger.error("Failed to restart SSHD")
-                return False, "Failed to restart SSH service"
+    def _configure_ssh(self) -> Tuple[bool, str]:
+        """SSH configuration (Tailscale-only). Returns (success, error_message)"""
+        self.logger.info("Configuring SSH...")
 
-            self.logger.info("SSH configuration completed")
+        if self.is_file_current(SSH_CONFIG_PATH, SSH_CONFIG_BYTES):
+            self.logger.info("SSH config unchanged, skipping reload")
+        else:
+            if not self.write_file_small(SSH_CONFIG_PATH, SSH_CONFIG_BYTES):
+                self.logger.error("Failed to write SSH config")
+                return False, "Failed to write SSH configuration"
 
-            # 4. Fail2ban configuration
-            self.logger.info("Configuring Fail2ban...")
+            # Reload keeps the listening socket and open sessions
+            if not self.systemctl('reload-or-restart', 'sshd'):
+                self.logger.error("Failed to reload SSHD")
+                return False, "Failed to reload SSH service"
 
-            # Check if fail2ban is installed
-            fail2ban_check = self.run_shell('which fail2ban-client', check=False)
-            if fail2ban_check.returncode != 0:
-                self.logger.error("Fail2ban is not installed!")
-                return False, "Fail2ban is not installed. Run install.sh first."
+        self.logger.info("SSH configuration completed")
+        return True, ""
 
-            fail2ban_config = """[sshd]
-enabled = true
-port = ssh
-filter = sshd
-backend = systemd
-maxretry = 3
-bantime = 3600
-findtime = 600
-"""
-            if not self.write_file('/etc/fail2ban/jail.d/sshd.conf', fail2ban_config):
+    def _configure_fail2ban(self) -> Tuple[bool, str]:
+        """Fail2ban configuration. Returns (success, error_message)"""
+        self.logger.info("Configuring Fail2ban...")
+
+        if self.is_file_current(FAIL2BAN_CONFIG_PATH, FAIL2BAN_CONFIG_BYTES):
+            self.logger.info("Fail2ban config unchanged, skipping reload")
+            # Enable + start (if not running) in one call
+            if not self.systemctl('enable', 'fail2ban', '--now'):
+                self.logger.error("Failed to start Fail2ban")
+                return False, "Failed to start Fail2ban service"
+        else:
+            if not self.write_file_small(FAIL2BAN_CONFIG_PATH, FAIL2BAN_CONFIG_BYTES):
                 self.logger.error("Failed to write Fail2ban config")
                 return False, "Failed to write Fail2ban configuration"
 
             self.systemctl('enable', 'fail2ban')
-            if not self.systemctl('restart', 'fail2ban'):
-                self.logger.error("Failed to restart Fail2ban")
-                return False, "Failed to restart Fail2ban service"
+            if not self.systemctl('reload-or-restart', 'fail2ban'):
+                self.logger.error("Failed to reload Fail2ban")
+                return False, "Failed to reload Fail2ban service"
 
-            self.logger.info("Fail2ban configuration completed")
+        self.logger.info("Fail2ban configuration completed")
+        return True, ""
 
-            self.logger.info("Security configuration completed")
-            return True, ""
+    def _make_restore(self, path: str, service: str) -> Callable[[], None]:
+        """
+        Snapshot a config file now; the returned callable puts it back
+        (or removes it if it did not exist) and reloads the service.
+        """
+        try:
+            with open(path, 'r') as f:
+                original = f.read()
+        except OSError:
+            original = None
+
+        def restore() -> None:
+            if original is None:
+                if not os.path.exists(path):
+                    return
+                os.remove(path)
+            elif self.is_file_current(path, original):
+                return
+            else:
+                self.write_file_small(path, original)
+            self.systemctl('reload-or-restart', service)
+            self.logger.info("Restored %s", path)
 
-        except Exception as e:
-            self.logger.error(f"Security configuration error: {e}")
-            return False, str(e)
+        return restore
+
+    def _current_rules(self) -> Optional[Set[Tuple]]:
+        """
+        Parse the loaded ufw-user-input rules in one iptables-save pass.
+        Returns a set of (interface, proto, ports, target) tuples,
+        or None if iptables-save fails.
+        """
+        result = self.run_command(['iptables-save', '-t', 'filter'], check=False)
+        if result.returncode != 0:
+            self.logger.error("iptables-save failed: %s", result.stderr)
+            return None
+
+        rules = set()
+        for line in result.stdout.splitlines():
+            if not line.startswith('-A ufw-user-input '):
+                continue
+            tokens = line.split()
+            options = {
+                key: value for key, value in zip(tokens, tokens[1:])
+                if key in ('-i', '-p', '--dport', '--dports', '-j')
+            }
+            rules.add((
+                options.get('-i'),
+                options.get('-p'),
+                _port_key(options.get('--dports') or options.get('--dport')),
+                options.get('-j'),
+            ))
+        return rules
+
+    def _verify_ufw_rules(self) -> bool:
+        """Check that every UFW_RULES entry is loaded in iptables"""
+        current = self._current_rules()
+        if current is None:
+            return False
+
+        missing = EXPECTED_RULES - current
+        for rule in missing:
+            self.logger.error("UFW rule not loaded: %s", rule)
+
+        extra = current - EXPECTED_RULES
+        if extra:
+            self.logger.warning("UFW has %s unexpected rules: %s", len(extra), sorted(extra, key=str))
+
+        if missing:
+            return False
+
+        self.logger.info("UFW rules verified: %s", len(EXPECTED_RULES))
+        return True
 
     def _save_rvm_id_to_mongodb(self, rvm_id: str, hardware_id: str) -> Tuple[bool, str]:
         """Save RVM ID to MongoDB. Returns (success, error_message)"""
         try:
-            import socket
-            from datetime import datetime
-            from pymongo import MongoClient
+            collection = _get_mongo_client()['aco']['settings']
+            hostname = socket.gethostname()
 
-            client = MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=5000)
-            db = client['aco']
-            collection = db['settings']
+            # Skip the write if the record is already current
+            existing = collection.find_one(
+                {}, {'rvm_id': 1, 'hardware_id': 1, 'hostname': 1, 'setup_complete': 1}
+            )
+            if (existing
+                    and existing.get('rvm_id') == rvm_id
+                    and existing.get('hardware_id') == hardware_id
+                    and existing.get('hostname') == hostname
+                    and existing.get('setup_complete') is False):
+                self.logger.info("RVM ID already saved in MongoDB: %s", rvm_id)
+                return True, ""
 
             # Create/update record
             document = {
                 'rvm_id': rvm_id,
                 'hardware_id': hardware_id,
-                'hostname': socket.gethostname(),
-                'registered_at': datetime.utcnow(),
+                'hostname': hostname,
+                'registered_at': datetime.now(timezone.utc),
                 'setup_complete': False
             }
 
             result = collection.update_one(
                 {},
-                {'$set': document},
+                {'$set': document, '$inc': {CONFIG_VERSION_FIELD: 1}},
                 upsert=True
             )
 
-            client.close()
-
             if result.modified_count > 0 or result.upserted_id:
-                self.logger.info(f"RVM ID saved to MongoDB: {rvm_id}")
+                self.logger.info("RVM ID saved to MongoDB: %s", rvm_id)
                 return True, ""
             else:
                 self.logger.error("MongoDB update returned no changes")
                 return False, "MongoDB update failed - no changes made"
 
         except Exception as e:
-            self.logger.error(f"MongoDB save error: {e}")
+            self.logger.error("MongoDB save error: %s", e)
             return False, f"MongoDB error: {str(e)}"
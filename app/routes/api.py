@@ -7,13 +7,16 @@ MongoDB-based config system.
 
 import os
 import re
+import json
 import subprocess
 import threading
 import logging
 import time
-from flask import Blueprint, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from flask import Blueprint, Response, jsonify, request
 
-from app.modules.base import mongo_config as config
+from app.modules.base import CONFIG_VERSION_FIELD, mongo_config as config
 from app.services.system import SystemService, DEFAULT_IP_CONFIGS
 from app.services.hardware import HardwareService
 from app.modules import get_module, get_all_modules
@@ -21,20 +24,160 @@ from app.modules import get_module, get_all_modules
 api_bp = Blueprint('api', __name__)
 logger = logging.getLogger(__name__)
 
+# Request validation (compiled/built once at import)
+RVM_ID_PATTERN = re.compile(r'^[A-Z0-9_-]+\Z')
+ALLOWED_LAYOUTS = frozenset({
+    'tr', 'us', 'de', 'fr', 'es', 'it', 'ru', 'ar', 'pt', 'nl',
+    'pl', 'sv', 'no', 'da', 'fi', 'el', 'hu', 'cs', 'ro', 'bg',
+    'hr', 'sk', 'sl', 'uk', 'az', 'gb', 'br', 'jp', 'kr'
+})
+
 # Active installation threads (for race condition control)
 _install_threads = {}
+_install_lock = threading.Lock()
 
-# Internet status cache - for instant response (doesn't block worker)
-_internet_cache = {
+# Internet status cache - for instant response (doesn't block worker).
+# (status, last_check) tuple, replaced whole by the single refresher thread
+# and never mutated, so readers need no lock.
+_internet_snapshot = ({
     'connected': None,
     'ip': None,
     'dns_working': None,
-    'tailscale_ip': None,
-    'last_check': 0
-}
-_cache_lock = threading.Lock()
+    'tailscale_ip': None
+}, 0.0)
 _CACHE_TTL = 3  # Valid for 3 seconds (for fast UI updates)
-_update_in_progress = False
+_CACHE_IDLE = 60  # Refresher sleeps after this long without a status request
+_last_status_request = 0.0
+
+# One long-lived refresher thread per worker, started on first request
+_refresh_event = threading.Event()
+_refresher = None
+_refresher_lock = threading.Lock()
+_first_refresh = threading.Event()  # Set once the first snapshot is published
+_FIRST_REFRESH_WAIT = 0.2  # seconds a cold-start request waits for it
+# Reused by every refresh (threads are created on first use)
+_internet_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='net-probe')
+# Runs 'nmcli connection up' after an IP change so the child is reaped
+_nm_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='nm-up')
+_NM_UP_TIMEOUT = 30  # seconds
+
+# Shared service instances (neither keeps per-request state)
+_system = SystemService()
+_hardware = HardwareService()
+
+# Read-only system endpoint results, reused across UI polls: {key: (expiry, value)}
+_probe_cache = {}
+_probe_lock = threading.Lock()
+_INFO_TTL = 2     # info, components, monitor, network history
+_DETAILS_TTL = 1  # monitor detail panels
+
+
+def _cached_probe(key, ttl: float, probe):
+    """Return probe() result, reused for ttl seconds across requests"""
+    now = time.monotonic()
+    with _probe_lock:
+        entry = _probe_cache.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    # Probe outside the lock - a slow probe must not block other endpoints
+    value = probe()
+    with _probe_lock:
+        _probe_cache[key] = (time.monotonic() + ttl, value)
+    return value
+
+
+# timedatectl list-timezones output (static for the life of the process)
+_timezones = None
+_timezones_set = frozenset()
+_timezones_json = b'[]'  # Pre-serialized for GET /system/timezone
+_timezones_lock = threading.Lock()
+
+
+def _get_timezones() -> list:
+    """Return available timezones, listing them once (an empty result is retried)"""
+    global _timezones, _timezones_set, _timezones_json
+    if _timezones is not None:
+        return _timezones
+
+    with _timezones_lock:
+        if _timezones is None:
+            result = subprocess.run(
+                ['timedatectl', 'list-timezones'],
+                capture_output=True, text=True, timeout=10
+            )
+            timezones = [tz.strip() for tz in result.stdout.split('\n') if tz.strip()]
+            if result.returncode != 0 or not timezones:
+                return []
+            _timezones_set = frozenset(timezones)
+            _timezones_json = json.dumps(timezones, separators=(',', ':')).encode()
+            _timezones = timezones
+    return _timezones
+
+
+def _tail_file(path: str, n: int, block: int = 8192) -> list:
+    """
+    Return the last n lines of a file (trailing whitespace stripped),
+    reading backwards in blocks (cost depends on n, not on file size).
+    """
+    if n <= 0:
+        return []
+
+    with open(path, 'rb') as f:
+        pos = os.fstat(f.fileno()).st_size
+        buf = b''
+        # n + 1 newlines guarantee the first kept line is complete
+        while pos > 0 and buf.count(b'\n') <= n:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+
+    return [line.rstrip().decode('utf-8', 'replace') for line in buf.splitlines()[-n:]]
+
+
+# NetworkManager ethernet connections by device: (fetched_at, {device: name})
+_nm_connections = (0.0, {})
+_NM_CONNECTIONS_TTL = 5  # seconds
+
+
+def _get_nm_connection(interface_name: str) -> Optional[str]:
+    """Return the ethernet connection name bound to a device (nmcli listed once per TTL)"""
+    global _nm_connections
+    fetched_at, connections = _nm_connections
+    if time.monotonic() - fetched_at > _NM_CONNECTIONS_TTL:
+        result = subprocess.run(
+            ['nmcli', '-t', '-f', 'NAME,TYPE,DEVICE', 'connection', 'show'],
+            capture_output=True, stdin=subprocess.DEVNULL, timeout=10
+        )
+        # Parsed as bytes; only the ethernet entries kept are decoded
+        connections = {}
+        for line in result.stdout.splitlines():
+            # NAME may contain ':' (escaped as '\:'); TYPE and DEVICE never do
+            parts = line.rsplit(b':', 2)
+            if len(parts) == 3 and parts[1] == b'802-3-ethernet' and parts[2]:
+                connections.setdefault(
+                    parts[2].decode('utf-8', 'replace'),
+                    parts[0].replace(b'\\:', b':').decode('utf-8', 'replace')
+                )
+        if result.returncode == 0:
+            _nm_connections = (time.monotonic(), connections)
+    return connections.get(interface_name)
+
+
+def _run_checked(command: list, timeout: int) -> tuple:
+    """
+    Run a command whose output only matters on failure.
+    stdout is discarded; stderr is decoded only for a non-zero exit.
+    Returns (returncode, stderr_text)
+    """
+    result = subprocess.run(
+        command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, timeout=timeout
+    )
+    if result.returncode == 0:
+        return 0, ''
+    return result.returncode, result.stderr.decode('utf-8', 'replace')
 
 
 # =============================================================================
@@ -44,8 +187,7 @@ _update_in_progress = False
 @api_bp.route('/system/info')
 def system_info():
     """Return system information"""
-    system = SystemService()
-    return jsonify(system.get_system_info())
+    return jsonify(_cached_probe('info', _INFO_TTL, _system.get_system_info))
 
 
 @api_bp.route('/system/internet')
@@ -54,68 +196,84 @@ def internet_status():
     Internet status - returns from cache instantly, updates in background.
     This way the worker never blocks and tab switches work instantly.
     """
-    global _update_in_progress
-
-    with _cache_lock:
-        cache_age = time.time() - _internet_cache['last_check']
-        result = {
-            'connected': _internet_cache['connected'],
-            'ip': _internet_cache['ip'],
-            'dns_working': _internet_cache['dns_working'],
-            'tailscale_ip': _internet_cache['tailscale_ip']
-        }
+    global _last_status_request
+
+    _last_status_request = time.time()
+    _ensure_internet_refresher()
+
+    # Cold start: give the first refresh a moment instead of returning all None
+    if not _first_refresh.is_set():
+        _first_refresh.wait(_FIRST_REFRESH_WAIT)
 
-    # If cache is stale or empty, update in background
-    if cache_age > _CACHE_TTL and not _update_in_progress:
-        _update_in_progress = True
-        threading.Thread(target=_update_internet_cache, daemon=True).start()
+    result, last_check = _internet_snapshot
+    cache_age = time.time() - last_check
+
+    # If cache is stale or empty (refresher was idle), wake it up
+    if cache_age > _CACHE_TTL:
+        _request_internet_refresh()
     
     return jsonify(result)
 
 
-def _update_internet_cache():
-    """Update internet status in background (doesn't block worker)"""
-    global _update_in_progress
-    try:
-        system = SystemService()
+def _ensure_internet_refresher() -> None:
+    """Start the internet status refresher thread once per worker"""
+    global _refresher
+    if _refresher is not None:
+        return
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_internet_cache_loop, daemon=True)
+            _refresher.start()
 
-        # Update each one separately (others continue even if one fails)
-        connected = None
-        ip = None
-        dns_working = None
-        tailscale_ip = None
-        
-        try:
-            connected = system.check_internet()
-        except Exception as e:
-            logger.debug(f"Internet check failed: {e}")
 
-        try:
-            ip = system.get_ip_address()
-        except Exception as e:
-            logger.debug(f"IP address check failed: {e}")
+def _request_internet_refresh() -> None:
+    """Refresh internet status now instead of at the next interval"""
+    _refresh_event.set()
 
-        try:
-            dns_working = system.check_dns()
-        except Exception as e:
-            logger.debug(f"DNS check failed: {e}")
 
-        try:
-            tailscale_ip = system.get_tailscale_ip()
-        except Exception as e:
-            logger.debug(f"Tailscale IP check failed: {e}")
-        
-        with _cache_lock:
-            _internet_cache['connected'] = connected
-            _internet_cache['ip'] = ip
-            _internet_cache['dns_working'] = dns_working
-            _internet_cache['tailscale_ip'] = tailscale_ip
-            _internet_cache['last_check'] = time.time()
+def _internet_cache_loop() -> None:
+    """
+    Refresh the internet cache every _CACHE_TTL seconds while the UI is
+    polling; when idle, wait until a request (or a forced refresh) wakes it.
+    """
+    while True:
+        # Clear before updating so a wake-up during the update is not lost
+        _refresh_event.clear()
+        _update_internet_cache()
+
+        idle = time.time() - _last_status_request > _CACHE_IDLE
+        _refresh_event.wait(None if idle else _CACHE_TTL)
+
+
+def _update_internet_cache():
+    """Update internet status in background (doesn't block worker)"""
+    global _internet_snapshot
+    try:
+        # Independent probes run concurrently; each one fails on its own
+        futures = {
+            key: _internet_executor.submit(probe)
+            for key, probe in (
+                ('connected', _system.check_internet),
+                ('ip', _system.get_ip_address),
+                ('dns_working', _system.check_dns),
+                ('tailscale_ip', _system.get_tailscale_ip),
+            )
+        }
+
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                logger.debug(f"{key} check failed: {e}")
+                results[key] = None
+
+        # Publish with one name rebinding (atomic for readers)
+        _internet_snapshot = (results, time.time())
+        _first_refresh.set()
             
     except Exception as e:
         logger.warning(f"Internet cache update failed: {e}")
-    finally:
-        _update_in_progress = False
 
 
 @api_bp.route('/system/reboot', methods=['POST'])
@@ -131,67 +289,59 @@ def reboot_system():
 @api_bp.route('/system/components')
 def system_components():
     """Return system component statuses (Docker, MongoDB, Tailscale, NVIDIA)"""
-    system = SystemService()
-    components = system.get_component_statuses()
-    return jsonify(components)
+    return jsonify(_cached_probe('components', _INFO_TTL, _system.get_component_statuses))
 
 
 @api_bp.route('/system/monitor')
 def system_monitor():
     """Return system monitor data (CPU, memory, disk, temp, network speed)"""
-    system = SystemService()
-    return jsonify(system.get_system_monitor())
+    return jsonify(_cached_probe('monitor', _INFO_TTL, _system.get_system_monitor))
 
 
 @api_bp.route('/system/monitor/cpu/details')
 def cpu_details():
     """Return detailed CPU info: per-core usage, top processes, load avg"""
-    system = SystemService()
-    return jsonify(system.get_cpu_details())
+    return jsonify(_cached_probe('cpu_details', _DETAILS_TTL, _system.get_cpu_details))
 
 
 @api_bp.route('/system/monitor/memory/details')
 def memory_details():
     """Return detailed memory info: breakdown, top processes, swap"""
-    system = SystemService()
-    return jsonify(system.get_memory_details())
+    return jsonify(_cached_probe('memory_details', _DETAILS_TTL, _system.get_memory_details))
 
 
 @api_bp.route('/system/monitor/gpu/details')
 def gpu_details():
     """Return detailed GPU info: utilization, top processes"""
-    system = SystemService()
-    return jsonify(system.get_gpu_details())
+    return jsonify(_cached_probe('gpu_details', _DETAILS_TTL, _system.get_gpu_details))
 
 
 @api_bp.route('/system/monitor/vram/details')
 def vram_details():
     """Return detailed VRAM info: per-process memory usage"""
-    system = SystemService()
-    return jsonify(system.get_vram_details())
+    return jsonify(_cached_probe('vram_details', _DETAILS_TTL, _system.get_vram_details))
 
 
 @api_bp.route('/system/monitor/disk/details')
 def disk_details():
     """Return detailed disk info: partitions, I/O stats, top processes"""
-    system = SystemService()
-    return jsonify(system.get_disk_details())
+    return jsonify(_cached_probe('disk_details', _DETAILS_TTL, _system.get_disk_details))
 
 
 @api_bp.route('/system/monitor/network/details')
 def network_details():
     """Return detailed network usage by application"""
-    system = SystemService()
-    return jsonify(system.get_network_details())
+    return jsonify(_cached_probe('network_details', _DETAILS_TTL, _system.get_network_details))
 
 
 @api_bp.route('/system/network-history')
 def network_history():
     """Return network traffic history from netmon database"""
     hours = request.args.get('hours', 24, type=int)
-    hours = min(hours, 168)  # max 7 days
-    system = SystemService()
-    return jsonify(system.get_network_history(hours))
+    hours = max(1, min(hours, 168))  # 1 hour to 7 days (bounds the cache keys)
+    return jsonify(_cached_probe(
+        ('network_history', hours), _INFO_TTL, lambda: _system.get_network_history(hours)
+    ))
 
 
 @api_bp.route('/system/timezone')
@@ -224,22 +374,21 @@ def get_timezone():
         except Exception:
             pass
 
-        timezones = []
+        timezones_json = b'[]'
         try:
-            result = subprocess.run(
-                ['timedatectl', 'list-timezones'],
-                capture_output=True, text=True, timeout=10
-            )
-            if result.returncode == 0:
-                timezones = [tz.strip() for tz in result.stdout.strip().split('\n') if tz.strip()]
+            if _get_timezones():
+                timezones_json = _timezones_json
         except Exception:
             pass
 
-        return jsonify({
-            'timezone': current_tz,
-            'ntp': ntp_active,
-            'timezones': timezones
-        })
+        # Only the small fields are encoded per request; the ~400-entry
+        # timezone list is spliced in pre-serialized
+        body = (
+            b'{"timezone":' + json.dumps(current_tz).encode()
+            + b',"ntp":' + (b'true' if ntp_active else b'false')
+            + b',"timezones":' + timezones_json + b'}'
+        )
+        return Response(body, mimetype='application/json')
     except Exception as e:
         logger.error(f"Timezone info error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -260,20 +409,13 @@ def set_timezone():
         return jsonify({'success': False, 'error': 'Invalid timezone format'}), 400
 
     try:
-        result = subprocess.run(
-            ['timedatectl', 'list-timezones'],
-            capture_output=True, text=True, timeout=10
-        )
-        valid_timezones = result.stdout.strip().split('\n')
-        if timezone not in valid_timezones:
+        _get_timezones()
+        if timezone not in _timezones_set:
             return jsonify({'success': False, 'error': f'Unknown timezone: {timezone}'}), 400
 
-        result = subprocess.run(
-            ['timedatectl', 'set-timezone', timezone],
-            capture_output=True, text=True, timeout=10
-        )
-        if result.returncode != 0:
-            return jsonify({'success': False, 'error': result.stderr or 'Failed to set timezone'}), 500
+        returncode, stderr = _run_checked(['timedatectl', 'set-timezone', timezone], timeout=10)
+        if returncode != 0:
+            return jsonify({'success': False, 'error': stderr or 'Failed to set timezone'}), 500
 
         logger.info(f"Timezone changed to: {timezone}")
         return jsonify({'success': True, 'timezone': timezone})
@@ -318,35 +460,38 @@ def set_keyboard():
     if not layout:
         return jsonify({'success': False, 'error': 'Layout required'}), 400
 
-    allowed_layouts = [
-        'tr', 'us', 'de', 'fr', 'es', 'it', 'ru', 'ar', 'pt', 'nl',
-        'pl', 'sv', 'no', 'da', 'fi', 'el', 'hu', 'cs', 'ro', 'bg',
-        'hr', 'sk', 'sl', 'uk', 'az', 'gb', 'br', 'jp', 'kr'
-    ]
-    if layout not in allowed_layouts:
+    if layout not in ALLOWED_LAYOUTS:
         return jsonify({'success': False, 'error': f'Unsupported layout: {layout}'}), 400
 
     errors = []
     try:
         # Persistent: write to X11 + console config files
-        result = subprocess.run(
-            ['localectl', 'set-x11-keymap', layout],
-            capture_output=True, text=True, timeout=10
-        )
-        if result.returncode != 0:
-            errors.append(f'localectl error: {result.stderr}')
-
-        # Immediate X11 effect (kiosk user's display)
-        subprocess.run(
-            ['sudo', '-u', 'kiosk', 'env', 'DISPLAY=:0', 'setxkbmap', layout],
-            capture_output=True, text=True, timeout=5
-        )
-
-        # Immediate console effect
-        subprocess.run(
-            ['setupcon', '--force'],
-            capture_output=True, text=True, timeout=5
-        )
+        returncode, stderr = _run_checked(['localectl', 'set-x11-keymap', layout], timeout=10)
+        if returncode != 0:
+            errors.append(f'localectl error: {stderr}')
+
+        # Immediate X11 (kiosk user's display) and console effect.
+        # Independent and best-effort - run in parallel, output unused.
+        # setupcon reads /etc/default/keyboard, so it starts after localectl.
+        procs = [
+            subprocess.Popen(
+                ['sudo', '-u', 'kiosk', 'env', 'DISPLAY=:0', 'setxkbmap', layout],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ),
+            subprocess.Popen(
+                ['setupcon', '--force'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ),
+        ]
+        deadline = time.monotonic() + 5
+        try:
+            for proc in procs:
+                proc.wait(timeout=max(0, deadline - time.monotonic()))
+        finally:
+            for proc in procs:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
     except subprocess.TimeoutExpired:
         return jsonify({'success': False, 'error': 'Operation timed out'}), 500
     except Exception as e:
@@ -367,10 +512,9 @@ def set_keyboard():
 @api_bp.route('/hardware/id')
 def hardware_id():
     """Return Hardware ID"""
-    hw = HardwareService()
     return jsonify({
-        'hardware_id': hw.get_hardware_id(),
-        'components': hw.get_components()
+        'hardware_id': _hardware.get_hardware_id(),
+        'components': _hardware.get_components()
     })
 
 
@@ -407,7 +551,7 @@ def set_rvm_id():
     if not rvm_id:
         return jsonify({'success': False, 'error': 'RVM ID required'}), 400
 
-    if not re.match(r'^[A-Z0-9_-]+$', rvm_id):
+    if not RVM_ID_PATTERN.match(rvm_id):
         return jsonify({
             'success': False,
             'error': 'Invalid format. Use only uppercase letters, numbers, hyphens and underscores'
@@ -416,8 +560,7 @@ def set_rvm_id():
     hostname = rvm_id.lower()
 
     # 1. Set system hostname
-    system = SystemService()
-    result = system.set_hostname(hostname)
+    result = _system.set_hostname(hostname)
     if not result['success']:
         return jsonify({'success': False, 'error': result['error']}), 500
 
@@ -473,7 +616,7 @@ def update_config():
         return jsonify({'success': False, 'error': 'No data found'}), 400
     
     errors = []
-    updated = []
+    updates = {}
     
     for key, value in data.items():
         # Check locked setting
@@ -482,15 +625,24 @@ def update_config():
             continue
 
         # System values cannot be changed
-        if key.startswith('system.') or key.startswith('modules.'):
+        if (key.startswith('system.') or key.startswith('modules.')
+                or key.split('.', 1)[0] == CONFIG_VERSION_FIELD):
             errors.append(f'{key} is managed by system')
             continue
+
+        # One $set cannot write both 'nvr' and 'nvr.username'
+        overlap = next((k for k in updates if key.startswith(k + '.') or k.startswith(key + '.')), None)
+        if overlap:
+            errors.append(f'{key} overlaps {overlap}')
+            continue
         
-        config.set(key, value)
-        updated.append(key)
+        updates[key] = value
     
-    if updated:
-        config.save()
+    # All accepted keys in one MongoDB write
+    updated = list(updates)
+    if updates and not config.set_many(updates):
+        errors.append('Failed to save settings')
+        updated = []
     
     return jsonify({
         'success': len(errors) == 0,
@@ -508,13 +660,10 @@ def list_modules():
     """List all modules"""
     config.reload()  # Multi-worker sync
     modules = get_all_modules()
-    statuses = config.get_all_module_statuses()
+    statuses = config.get_polled_module_statuses()
     
-    result = []
-    for module in modules:
-        info = module.get_info()
-        info['status'] = statuses.get(info['name'], 'pending')
-        result.append(info)
+    # Statuses come from the one read above, not a lookup per module
+    result = [module.get_info(statuses.get(module.name, 'pending')) for module in modules]
     
     return jsonify(result)
 
@@ -528,8 +677,8 @@ def module_info(module_name: str):
     if not module:
         return jsonify({'error': 'Module not found'}), 404
     
-    info = module.get_info()
-    info['status'] = config.get_module_status(module_name)
+    status = config.get_polled_module_statuses().get(module_name, 'pending')
+    info = module.get_info(status)
     info['can_install'] = module.can_install()
     
     return jsonify(info)
@@ -556,23 +705,26 @@ def install_module(module_name: str):
     if config.is_module_completed(module_name):
         return jsonify({'success': False, 'error': 'Module already installed'}), 400
 
-    # Already installing? (thread check)
-    if module_name in _install_threads and _install_threads[module_name].is_alive():
-        return jsonify({'success': False, 'error': 'Module installation already in progress'}), 400
-
-    # Set status to installing
-    config.set_module_status(module_name, 'installing')
-    logger.info(f"Starting module installation (async): {module_name}")
-
-    # Start background thread
-    thread = threading.Thread(
-        target=_run_install_background,
-        args=(module_name,),
-        daemon=True,
-        name=f"install-{module_name}"
-    )
-    _install_threads[module_name] = thread
-    thread.start()
+    # Check-and-start under one lock: two concurrent POSTs must not both
+    # pass the "already installing?" check
+    with _install_lock:
+        existing = _install_threads.get(module_name)
+        if existing is not None and existing.is_alive():
+            return jsonify({'success': False, 'error': 'Module installation already in progress'}), 400
+
+        # Set status to installing
+        config.set_module_status(module_name, 'installing')
+        logger.info(f"Starting module installation (async): {module_name}")
+
+        # Start background thread
+        thread = threading.Thread(
+            target=_run_install_background,
+            args=(module_name,),
+            daemon=True,
+            name=f"install-{module_name}"
+        )
+        _install_threads[module_name] = thread
+        thread.start()
     
     return jsonify({
         'success': True,
@@ -619,16 +771,20 @@ def _run_install_background(module_name: str):
         config.set_module_status(module_name, 'failed')
         logger.exception(f"Installation exception: {module_name} - {e}")
     finally:
-        # Clean up thread reference
-        if module_name in _install_threads:
-            del _install_threads[module_name]
+        # Installs can change connectivity (e.g. Tailscale IP)
+        _request_internet_refresh()
+
+        # Clean up thread reference (only our own entry)
+        with _install_lock:
+            if _install_threads.get(module_name) is threading.current_thread():
+                del _install_threads[module_name]
 
 
 @api_bp.route('/modules/<module_name>/status')
 def module_status(module_name: str):
     """Return module status"""
     config.reload()  # For current status
-    status = config.get_module_status(module_name)
+    status = config.get_polled_module_statuses().get(module_name, 'pending')
     return jsonify({
         'module': module_name,
         'status': status
@@ -687,20 +843,17 @@ def module_logs(module_name: str):
     # Get last N lines (configurable via query param)
     lines = int(request.args.get('lines', 200))
 
-    logs = []
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r') as f:
-                all_lines = f.readlines()
-                logs = all_lines[-lines:] if len(all_lines) > lines else all_lines
-        except Exception as e:
-            logs = [f"Log read error: {e}"]
-    else:
+    # open() reports a missing file itself - no separate exists() stat
+    try:
+        logs = _tail_file(log_file, lines)
+    except FileNotFoundError:
         logs = [f"Log file not found: {log_file}"]
+    except Exception as e:
+        logs = [f"Log read error: {e}"]
     
     return jsonify({
         'module': module_name,
-        'logs': [line.rstrip() for line in logs],
+        'logs': logs,
         'total_lines': len(logs)
     })
 
@@ -726,8 +879,7 @@ def get_network_interfaces():
         }
     }
     """
-    system = SystemService()
-    interfaces = system.get_ethernet_interfaces()
+    interfaces = _system.get_ethernet_interfaces()
 
     return jsonify({
         'interfaces': interfaces,
@@ -739,6 +891,17 @@ def get_network_interfaces():
 # IP CONFIGURATION API (NetworkManager)
 # =============================================================================
 
+def _log_nm_up(future):
+    """Log a failed background 'nmcli connection up'."""
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.error(f"nmcli connection up error: {e}")
+        return
+    if result.returncode != 0:
+        logger.error(f"nmcli connection up exited with {result.returncode}: {' '.join(result.args)}")
+
+
 @api_bp.route('/network/set-ip', methods=['POST'])
 def set_network_ip():
     """
@@ -775,8 +938,7 @@ def set_network_ip():
 
     try:
         # Get interface type (onboard/pcie) to determine default IP
-        system = SystemService()
-        interfaces = system.get_ethernet_interfaces()
+        interfaces = _system.get_ethernet_interfaces()
         interface_info = next((i for i in interfaces if i['name'] == interface_name), None)
 
         if not interface_info:
@@ -790,19 +952,7 @@ def set_network_ip():
             return jsonify({'success': False, 'error': f'Mode {mode} not available for {interface_type} interface'}), 400
 
         # Find NetworkManager connection for this interface
-        result = subprocess.run(
-            ['nmcli', '-t', '-f', 'NAME,TYPE,DEVICE', 'connection', 'show'],
-            capture_output=True, text=True, timeout=10
-        )
-
-        connection_name = None
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                parts = line.split(':')
-                # parts: [NAME, TYPE, DEVICE]
-                if len(parts) >= 3 and parts[1] == '802-3-ethernet' and parts[2] == interface_name:
-                    connection_name = parts[0]
-                    break
+        connection_name = _get_nm_connection(interface_name)
 
         # If no connection for this device, try to find by device name or create one
         if not connection_name:
@@ -860,13 +1010,18 @@ def set_network_ip():
             msg = f'DHCP enabled on {interface_name}'
 
         # Run modify command (blocking - need to verify success)
-        result = subprocess.run(cmds[0], capture_output=True, text=True, timeout=10)
-        if result.returncode != 0:
-            logger.error(f"nmcli modify error: {result.stderr}")
-            return jsonify({'success': False, 'error': result.stderr or 'nmcli error'}), 500
+        returncode, stderr = _run_checked(cmds[0], timeout=10)
+        if returncode != 0:
+            logger.error(f"nmcli modify error: {stderr}")
+            return jsonify({'success': False, 'error': stderr or 'nmcli error'}), 500
 
         # Run connection up (non-blocking - don't wait for IP change)
-        subprocess.Popen(cmds[1])
+        future = _nm_pool.submit(
+            subprocess.run, cmds[1],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, timeout=_NM_UP_TIMEOUT
+        )
+        future.add_done_callback(_log_nm_up)
 
         logger.info(msg)
         return jsonify({'success': True, 'message': msg})
@@ -915,23 +1070,26 @@ def setup_status():
     """Return setup status"""
     config.reload()  # Multi-worker sync
 
-    # Get defined modules (actual module count, not MongoDB entries)
-    defined_modules = get_all_modules()
-    module_names = [m.name for m in defined_modules]
-    total = len(module_names)
-
-    # Get statuses from MongoDB
-    statuses = config.get_all_module_statuses()
+    # Get statuses from MongoDB (shared with other status polls)
+    statuses = config.get_polled_module_statuses()
 
-    # Count completed modules (only from defined modules)
-    completed = sum(1 for name in module_names if statuses.get(name) == 'completed')
+    # Status and completed count of defined modules (actual module count,
+    # not MongoDB entries) in one pass
+    module_statuses = {}
+    completed = 0
+    for module in get_all_modules():
+        status = statuses.get(module.name, 'pending')
+        module_statuses[module.name] = status
+        if status == 'completed':
+            completed += 1
+    total = len(module_statuses)
 
     return jsonify({
         'complete': config.is_setup_complete(),
         'total_modules': total,
         'completed_modules': completed,
         'progress': int((completed / total) * 100) if total > 0 else 0,
-        'module_statuses': {name: statuses.get(name, 'pending') for name in module_names}
+        'module_statuses': module_statuses
     })
 
 
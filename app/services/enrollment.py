@@ -4,16 +4,36 @@ Enrollment API client
 """
 
 import time
+import random
 import logging
 import warnings
 import requests
-from typing import Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Iterator, Optional
 
 from app.modules.base import mongo_config
 
 logger = logging.getLogger(__name__)
 
 ENROLLMENT_TIMEOUT = 30
+# Transport-level retries for idempotent requests (connect errors, resets)
+ENROLLMENT_RETRIES = 3
+
+# Approval polling backoff (seconds)
+APPROVAL_POLL_START = 1.0
+APPROVAL_POLL_FACTOR = 2.0
+APPROVAL_POLL_JITTER = 0.2
+# Long-poll hold requested from the status endpoint (seconds)
+APPROVAL_LONG_POLL = 25
+
+
+def _backoff(start: float, cap: float, jitter: float, factor: float = 2.0) -> Iterator[float]:
+    """Exponential delays start, factor*start, ... capped at cap, with +/- jitter fraction"""
+    delay = start
+    while True:
+        yield delay * random.uniform(1 - jitter, 1 + jitter)
+        delay = min(delay * factor, cap)
 
 
 class EnrollmentService:
@@ -24,6 +44,14 @@ class EnrollmentService:
             api_url = mongo_config.get_enrollment_url()
         self.api_url = api_url.rstrip('/')
         self.session = requests.Session()
+        # One kept-alive connection to the enrollment API, reused by polling
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=1,
+            max_retries=Retry(total=ENROLLMENT_RETRIES, backoff_factor=0.2)
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'Content-Type': 'application/json',
             'Accept': 'application/json'
@@ -129,12 +157,15 @@ class EnrollmentService:
                 'error': str(e)
             }
     
-    def check_status(self, hardware_id: str) -> Dict[str, Any]:
+    def check_status(self, hardware_id: str, wait: int = 0) -> Dict[str, Any]:
         """
         Check enrollment status.
 
         Args:
             hardware_id: Hardware ID (query with HARDWARE_ID!)
+            wait: Ask the server to hold the request up to this many seconds
+                until the status changes (long-poll). Servers without
+                long-poll support ignore it and answer immediately.
 
         Returns:
             Status info (pending, approved, rejected, expired)
@@ -143,7 +174,8 @@ class EnrollmentService:
             # CORRECT ENDPOINT: /api/enroll/{hardware_id}/status
             response = self.session.get(
                 f"{self.api_url}/api/enroll/{hardware_id}/status",
-                timeout=ENROLLMENT_TIMEOUT
+                params={'wait': wait} if wait else None,
+                timeout=ENROLLMENT_TIMEOUT + wait
             )
             
             if response.status_code == 200:
@@ -197,30 +229,48 @@ class EnrollmentService:
         Args:
             hardware_id: Hardware ID (query with HARDWARE_ID!)
             timeout: Maximum wait time (seconds). None = wait indefinitely
-            poll_interval: Check interval (seconds) - default 30s
+            poll_interval: Maximum check interval (seconds) - default 30s.
+                Checks start at 1s and back off exponentially up to this.
+                Each check long-polls the server, and time spent held
+                there counts against the next delay.
 
         Returns:
             Tailscale auth key or None (rejected)
         """
-        start_time = time.time()
+        start_time = time.monotonic()
+        deadline = start_time + timeout if timeout else None
+        delays = _backoff(APPROVAL_POLL_START, poll_interval, APPROVAL_POLL_JITTER, APPROVAL_POLL_FACTOR)
+
+        def pause(delay: float) -> None:
+            """Sleep until the next check, never past the deadline"""
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
 
         if timeout:
-            logger.info(f"Waiting for admin approval... (max {timeout}s, checking every {poll_interval}s)")
+            logger.info(f"Waiting for admin approval... (max {timeout}s, checking up to every {poll_interval}s)")
         else:
-            logger.info(f"Waiting for admin approval... (no timeout, checking every {poll_interval}s)")
+            logger.info(f"Waiting for admin approval... (no timeout, checking up to every {poll_interval}s)")
 
+        # Polls reuse self.session, so the connection is kept alive between checks
         while True:
             # Check timeout if set
-            if timeout and (time.time() - start_time) >= timeout:
+            if deadline is not None and time.monotonic() >= deadline:
                 logger.error("Timeout - approval not received")
                 return None
 
-            # Status check with HARDWARE_ID
-            status_result = self.check_status(hardware_id)
+            # Status check with HARDWARE_ID, held server-side until it changes
+            wait = APPROVAL_LONG_POLL
+            if deadline is not None:
+                wait = max(0, min(wait, int(deadline - time.monotonic())))
+            poll_start = time.monotonic()
+            status_result = self.check_status(hardware_id, wait=wait)
+            held = time.monotonic() - poll_start
 
             if not status_result.get('success'):
                 logger.warning(f"Status check failed: {status_result.get('error')}")
-                time.sleep(poll_interval)
+                pause(next(delays))
                 continue
 
             enrollment_status = status_result.get('status')
@@ -243,14 +293,14 @@ class EnrollmentService:
                 logger.warning("Auth key expired, waiting for new approval...")
 
             # pending - continue waiting
-            elapsed = int(time.time() - start_time)
+            elapsed = int(time.monotonic() - start_time)
             if timeout:
                 remaining = timeout - elapsed
                 logger.info(f"Waiting... ({remaining}s remaining)")
             else:
                 logger.info(f"Waiting for approval... ({elapsed}s elapsed)")
 
-            time.sleep(poll_interval)
+            pause(next(delays) - held)
     
     def cancel_enrollment(self, rvm_id: str) -> bool:
         """
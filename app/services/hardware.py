@@ -6,7 +6,7 @@ Hardware ID generation
 import subprocess
 import hashlib
 import logging
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -20,11 +20,30 @@ HDPARM = '/usr/sbin/hdparm'
 class HardwareService:
     """Hardware ID generation and hardware information"""
 
+    # Probe results shared by all instances (hardware does not change
+    # while the process runs)
+    _cache: Dict[str, Any] = {}
+
+    def _cached(self, key: str, probe: Callable[[], Any]) -> Any:
+        """
+        Return cached probe result, running the probe on first use.
+        Empty results are not cached so a failed probe is retried.
+        """
+        if key in HardwareService._cache:
+            return HardwareService._cache[key]
+
+        result = probe()
+        if result:
+            HardwareService._cache[key] = result
+        return result
+
     def get_hardware_id(self) -> str:
         """
         Generate unique Hardware ID.
         Created from motherboard, RAM and disk serial numbers.
         Format: MOBO_SERIAL:xxx|RAM_SERIALS:xxx|DISK_SERIALS:xxx
+        Not cached itself: a serial probe that failed is retried on the
+        next call instead of pinning an ID built without it.
         """
         components = self.get_components()
 
@@ -42,11 +61,11 @@ class HardwareService:
         return ''
     
     def get_components(self) -> Dict[str, str]:
-        """Get hardware component information"""
+        """Get hardware component information (each serial probed once per process)"""
         return {
-            'motherboard_serial': self._get_motherboard_serial(),
-            'ram_serials': self._get_ram_serials(),
-            'disk_serials': self._get_disk_serials()
+            'motherboard_serial': self._cached('motherboard_serial', self._get_motherboard_serial),
+            'ram_serials': self._cached('ram_serials', self._get_ram_serials),
+            'disk_serials': self._cached('disk_serials', self._get_disk_serials)
         }
     
     def _get_motherboard_serial(self) -> str:
@@ -211,7 +230,11 @@ class HardwareService:
         return info
     
     def get_motherboard_uuid(self) -> str:
-        """Get motherboard UUID"""
+        """Get motherboard UUID (read once per process)"""
+        return self._cached('motherboard_uuid', self._read_motherboard_uuid)
+
+    def _read_motherboard_uuid(self) -> str:
+        """Read motherboard UUID from sysfs"""
         try:
             with open('/sys/class/dmi/id/product_uuid', 'r') as f:
                 return f.read().strip()
@@ -220,7 +243,11 @@ class HardwareService:
         return ''
 
     def get_mac_addresses(self) -> str:
-        """Get all network interface MAC addresses (comma-separated)"""
+        """Get all network interface MAC addresses (comma-separated, probed once per process)"""
+        return self._cached('mac_addresses', self._read_mac_addresses)
+
+    def _read_mac_addresses(self) -> str:
+        """Read MAC addresses from 'ip link show'"""
         try:
             result = subprocess.run(
                 ['ip', 'link', 'show'],
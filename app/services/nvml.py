@@ -0,0 +1,81 @@
+"""
+ACO Maintenance Panel - NVML Service
+Process-wide NVML session (pynvml)
+
+nvmlInit is expensive (dlopen + symbol resolution), so it is done once
+per process and shut down at exit. Failed inits are not cached - the
+driver may become available later (after MOK enrollment / reboot).
+"""
+
+import atexit
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_nvml = None
+_nvml_lock = threading.Lock()
+
+
+def _shutdown() -> None:
+    """Shutdown NVML at process exit"""
+    global _nvml
+    if _nvml is not None:
+        try:
+            _nvml.nvmlShutdown()
+        except Exception:
+            pass
+        _nvml = None
+
+
+def get_nvml():
+    """
+    Return initialized pynvml module, or None.
+    None if pynvml is not installed or the driver is not usable.
+    """
+    global _nvml
+
+    if _nvml is not None:
+        return _nvml
+
+    with _nvml_lock:
+        if _nvml is None:
+            try:
+                import pynvml
+            except ImportError:
+                return None
+
+            try:
+                pynvml.nvmlInit()
+            except Exception as e:
+                logger.debug(f"NVML init failed: {e}")
+                return None
+
+            atexit.register(_shutdown)
+            _nvml = pynvml
+
+    return _nvml
+
+
+def is_driver_working() -> Optional[bool]:
+    """
+    Check NVIDIA driver via NVML (nvidia-smi equivalent, no fork).
+
+    Returns:
+        True/False, or None if pynvml is not installed (caller falls back)
+    """
+    try:
+        import pynvml  # noqa: F401
+    except ImportError:
+        return None
+
+    nvml = get_nvml()
+    if nvml is None:
+        return False
+
+    try:
+        return nvml.nvmlDeviceGetCount() > 0
+    except Exception as e:
+        logger.debug(f"NVML device query failed: {e}")
+        return False
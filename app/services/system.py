@@ -1277,6 +1277,11 @@ class SystemService:
         if len(hostname) > 63:
             return {'success': False, 'error': 'Hostname too long (max 63 chars)'}
 
+        # Already applied - skip hostnamectl (D-Bus round-trip) and /etc/hosts rewrite
+        if self._hostname_current(hostname):
+            logger.info(f"Hostname already set: {hostname}")
+            return {'success': True, 'error': None}
+
         # 2. BACKUP
         backup = self._backup_hostname_state()
 
@@ -1308,6 +1313,23 @@ class SystemService:
             else:
                 return {'success': False, 'error': f'{error_msg} (WARNING: rollback failed!)'}
 
+    def _hostname_current(self, hostname: str) -> bool:
+        """Check kernel, static (/etc/hostname) and /etc/hosts hostname in-process"""
+        import re
+
+        if socket.gethostname() != hostname:
+            return False
+        try:
+            with open('/etc/hostname', 'r') as f:
+                if f.read().strip() != hostname:
+                    return False
+            with open('/etc/hosts', 'r') as f:
+                hosts = f.read()
+        except OSError:
+            return False
+        pattern = rf'^127\.0\.1\.1\s+{re.escape(hostname)}\s*$'
+        return re.search(pattern, hosts, flags=re.MULTILINE) is not None
+
     def _backup_hostname_state(self) -> dict:
         """Backup current hostname and /etc/hosts"""
         backup = {}
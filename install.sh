@@ -1044,7 +1044,8 @@ if [[ "$MONGO_READY" == "true" ]]; then
                         headscale_url: "https://headscale.xofyy.com",
                         enrollment_url: "https://enrollment.xofyy.com"
                     },
-                    setup_complete: false
+                    setup_complete: false,
+                    config_version: 1
                 }
             },
             {upsert: true}